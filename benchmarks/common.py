@@ -0,0 +1,185 @@
+"""
+Общее для бенчмарков: Bot без Telegram, тестовая база и сценарий пользователя.
+Заглушка Bot API отвечает сразу (или с заданной задержкой сети) и запоминает
+кнопки последнего сообщения в каждом чате, а сценарий пользователя нажимает
+их, как живой человек. Поэтому одни и те же бенчмарки работают и с текущим
+кодом, и со старыми версиями бота из git.
+"""
+import asyncio
+import itertools
+import os
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import Chat, Message, PhotoSize
+
+STUB_TOKEN = "42:benchmark"
+# ID пользователей сценария, не пересекаются с ADMIN_IDS бенчмарка
+FIRST_USER_ID = 10_000
+BENCH_ADMIN_ID = 1
+
+
+def bench_environment():
+    """Переменные окружения для бота в бенчмарке: без лимитов частоты и живых токенов"""
+    os.environ.update({
+        "BOT_TOKEN": STUB_TOKEN,
+        "ADMIN_IDS": str(BENCH_ADMIN_ID),
+        "THROTTLE_CAROUSEL_RATE": "1000000",
+        "THROTTLE_CAROUSEL_BURST": "1000000",
+        "THROTTLE_COMMANDS_RATE": "1000000",
+        "THROTTLE_COMMANDS_BURST": "1000000",
+    })
+
+
+class StubSession(BaseSession):
+    """Сессия Bot API, которая не ходит в сеть"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = 0
+        self._message_ids = itertools.count(1000)
+        # Чат -> (id сообщения, есть ли фото, [callback_data кнопок])
+        self.last_keyboard: Dict[int, Tuple[int, bool, List[str]]] = {}
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        chat_id = getattr(method, "chat_id", None)
+        if method.__returning__ is bool:
+            return True
+        if isinstance(chat_id, int):
+            has_photo = hasattr(method, "photo") or hasattr(method, "media")
+            message_id = getattr(method, "message_id", None) or next(self._message_ids)
+            markup = getattr(method, "reply_markup", None)
+            if markup is not None and hasattr(markup, "inline_keyboard"):
+                buttons = [button.callback_data for row in markup.inline_keyboard for button in row]
+                self.last_keyboard[chat_id] = (message_id, has_photo, buttons)
+            message = fake_message(chat_id, message_id, has_photo).as_(bot)
+            if isinstance(getattr(method, "media", None), list):
+                return [message for _ in method.media]
+            return message
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def fake_message(chat_id: int, message_id: int, photo: bool = False) -> Message:
+    return Message(
+        message_id=message_id,
+        date=datetime.now(),
+        chat=Chat(id=chat_id, type="private"),
+        photo=[PhotoSize(file_id=f"photo{message_id}", file_unique_id=f"u{message_id}", width=1, height=1)]
+        if photo else None,
+    )
+
+
+def make_bot(latency: float = 0.0) -> Bot:
+    return Bot(token=STUB_TOKEN, session=StubSession(latency))
+
+
+def seed_database(path: str, ads: int, promos: int = 3):
+    """
+    Наполняет созданную ботом схему объявлениями с фото.
+    Пишет напрямую через sqlite3, чтобы работать с любой версией моделей.
+    Соединение закрывается, чтобы WAL попал в файл базы и его можно было копировать
+    """
+    now = datetime.utcnow()
+    with closing(sqlite3.connect(path)) as conn, conn:
+        for idx in range(ads + promos):
+            is_promo = idx >= ads
+            created = (now - timedelta(minutes=idx)).strftime("%Y-%m-%d %H:%M:%S.%f")
+            cursor = conn.execute(
+                "INSERT INTO advertisements (description, price, manager_link, created_at, updated_at, "
+                "is_promotional, views_count) VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (f"Квартира {idx} у метро, рядом парк", f"{40 + idx % 50}.000₽/месяц",
+                 None if is_promo else "@manager", created, created, is_promo),
+            )
+            for position in range(3):
+                conn.execute(
+                    "INSERT INTO photos (advertisement_id, photo_file_id, position) VALUES (?, ?, ?)",
+                    (cursor.lastrowid, f"file_{cursor.lastrowid}_{position}", position),
+                )
+
+
+_update_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> Dict:
+    return {"id": user_id, "is_bot": False, "first_name": "Bench", "username": f"user{user_id}"}
+
+
+def message_update(user_id: int, text: str) -> Dict:
+    return {
+        "update_id": next(_update_ids),
+        "message": {
+            "message_id": next(_update_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": _user(user_id),
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}] if text.startswith("/") else [],
+        },
+    }
+
+
+def callback_update(session: StubSession, user_id: int, prefix: str) -> Optional[Dict]:
+    """Нажатие кнопки с данным префиксом в последнем сообщении с кнопками, None — такой нет"""
+    message_id, has_photo, buttons = session.last_keyboard.get(user_id, (0, False, []))
+    data = next((button for button in buttons if button and button.startswith(prefix)), None)
+    if data is None:
+        return None
+    message = {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": 42, "is_bot": True, "first_name": "Bot"},
+    }
+    if has_photo:
+        message["photo"] = [{"file_id": "photo", "file_unique_id": "u", "width": 1, "height": 1}]
+    else:
+        message["text"] = "..."
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "message": message,
+            "data": data,
+        },
+    }
+
+
+async def browse(feed, session: StubSession, user_id: int, taps: int):
+    """
+    Сценарий пользователя: /start, "Смотреть объявления" и taps нажатий ➡️.
+    feed(kind, update) обрабатывает апдейт и возвращается, когда он обработан
+    """
+    await feed("start", message_update(user_id, "/start"))
+    update = callback_update(session, user_id, "show_ads")
+    if update is None:
+        return
+    await feed("show_ads", update)
+    for _ in range(taps):
+        update = callback_update(session, user_id, "next_")
+        if update is None:
+            break
+        await feed("next", update)
+
+
+def percentile(values: List[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
@@ -0,0 +1,182 @@
+"""
+Задержка обработчиков (p50/p95/p99) до и после изменения, без Telegram.
+Пользователи одновременно проходят сценарий /start, "Смотреть объявления"
+и листание ➡️ на настоящем файле SQLite, Bot API заменён заглушкой.
+Время апдейта — от передачи в диспетчер до конца обработки: синхронный
+запрос к БД в одном обработчике задерживает и все остальные.
+
+Сравнение с другой версией бота (она выкладывается во временный git worktree):
+
+    python benchmarks/handler_latency.py --baseline <коммит до изменения> --users 100 --taps 10
+
+Каждая версия измеряется в отдельном процессе этим же скриптом.
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from common import FIRST_USER_ID, bench_environment, browse, make_bot, percentile, seed_database
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+KINDS = ("start", "show_ads", "next", "all")
+
+
+async def open_bot_database(path: Path, ads: int):
+    """
+    Поднимает БД и диспетчер версии бота из sys.path так же, как её main.py.
+    Возвращает (диспетчер, функцию остановки); работает и со старым
+    синхронным слоем БД, и с асинхронным
+    """
+    from aiogram import Dispatcher
+    from aiogram.fsm.storage.memory import MemoryStorage
+    from bot import config
+
+    # Та же схема URL (драйвер), что у версии бота, но временный файл
+    config.DATABASE_URL = f"{config.DATABASE_URL.split(':///')[0]}:///{path}"
+    import main as app
+    from bot.handlers import admin, user
+
+    try:
+        from bot.database import session as db
+    except ImportError:
+        db = None
+
+    if db is not None and inspect.iscoroutinefunction(db.setup_engine):
+        await db.setup_engine(config.DATABASE_URL)
+        seed_database(str(path), ads)
+        if hasattr(app, "create_dispatcher"):
+            # Как run_single в main.py: один процесс со всеми фоновыми задачами
+            await app.start_services()
+            from bot.utils.fsm_storage import create_fsm_storage
+            storage = create_fsm_storage()
+            return app.create_dispatcher(storage), lambda bot: app.stop_services(bot, storage)
+        dp = Dispatcher(storage=MemoryStorage())
+
+        @dp.update.middleware()
+        async def database_middleware(handler, event, data):
+            async with db.get_session() as session:
+                data["session"] = session
+                return await handler(event, data)
+    else:
+        if db is not None:
+            db.setup_engine(config.DATABASE_URL)
+            session_factory = db.get_session
+        else:
+            # Самая старая версия создаёт движок на каждый апдейт
+            session_factory = app.get_session
+        # Первая сессия создаёт схему
+        session_factory().close()
+        seed_database(str(path), ads)
+        dp = Dispatcher(storage=MemoryStorage())
+
+        @dp.update.middleware()
+        async def database_middleware(handler, event, data):
+            session = session_factory()
+            data["session"] = session
+            try:
+                return await handler(event, data)
+            finally:
+                session.close()
+
+    dp.include_router(admin.router)
+    dp.include_router(user.router)
+
+    async def stop(bot):
+        if db is not None:
+            result = db.dispose_engine()
+            if inspect.isawaitable(result):
+                await result
+    return dp, stop
+
+
+async def measure(tree: Path, users: int, taps: int, latency: float, ads: int):
+    """Прогоняет сценарии в версии бота из tree и печатает задержки в JSON"""
+    sys.path.insert(0, str(tree))
+    bench_environment()
+    logging.basicConfig(level=logging.ERROR)
+
+    workdir = Path(tempfile.mkdtemp(prefix="bot-latency-"))
+    # main.py открывает bot.log в текущем каталоге
+    os.chdir(workdir)
+    try:
+        dp, stop = await open_bot_database(workdir / "bench.db", ads)
+        bot = make_bot(latency)
+        latencies = defaultdict(list)
+
+        async def feed(kind, update):
+            started = time.perf_counter()
+            await dp.feed_raw_update(bot, update)
+            latencies[kind].append(time.perf_counter() - started)
+
+        await asyncio.gather(*(browse(feed, bot.session, FIRST_USER_ID + idx, taps) for idx in range(users)))
+        await stop(bot)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(latencies))
+
+
+def run_version(tree: Path, args) -> dict:
+    """Измеряет версию бота из tree в отдельном процессе"""
+    command = [
+        sys.executable, str(Path(__file__).resolve()), "--measure", str(tree),
+        "--users", str(args.users), "--taps", str(args.taps), "--latency", str(args.latency), "--ads", str(args.ads),
+    ]
+    output = subprocess.run(command, cwd=tree, check=True, capture_output=True, text=True).stdout
+    latencies = json.loads(output.strip().splitlines()[-1])
+    latencies["all"] = [value for values in latencies.values() for value in values]
+    return latencies
+
+
+def print_report(results: dict):
+    print(f"{'version':>10} {'handler':>9} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for kind in KINDS:
+        for version, latencies in results.items():
+            values = latencies.get(kind)
+            if not values:
+                continue
+            print(
+                f"{version:>10} {kind:>9} {len(values):>6} "
+                f"{percentile(values, 0.5) * 1000:>8.1f} {percentile(values, 0.95) * 1000:>8.1f} "
+                f"{percentile(values, 0.99) * 1000:>8.1f} {max(values) * 1000:>8.1f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", help="Git-ссылка на версию для сравнения, например коммит до изменения")
+    parser.add_argument("--users", type=int, default=100, help="Одновременных пользователей")
+    parser.add_argument("--taps", type=int, default=10, help="Нажатий ➡️ на пользователя")
+    parser.add_argument("--ads", type=int, default=500, help="Объявлений в базе")
+    parser.add_argument("--latency", type=float, default=0.02, help="Задержка ответа Bot API, сек")
+    parser.add_argument("--measure", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        asyncio.run(measure(args.measure, args.users, args.taps, args.latency, args.ads))
+        return
+
+    results = {}
+    if args.baseline:
+        worktree = Path(tempfile.mkdtemp(prefix="bot-baseline-"))
+        subprocess.run(["git", "-C", str(REPO_ROOT), "worktree", "add", "--detach", str(worktree), args.baseline],
+                       check=True, capture_output=True)
+        try:
+            results["baseline"] = run_version(worktree, args)
+        finally:
+            subprocess.run(["git", "-C", str(REPO_ROOT), "worktree", "remove", "--force", str(worktree)], check=True)
+    results["current"] = run_version(REPO_ROOT, args)
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Пропускная способность режима нескольких процессов (WORKERS) без Telegram.
+Сначала апдейты записываются: сценарии пользователей (/start, "Смотреть
+объявления", листание ➡️) прогоняются через обычный диспетчер бота.
+Затем для каждого числа воркеров те же апдейты раздаются воркерам по хэшу
+пользователя, как это делает супервизор, и обрабатываются serve_updates
+с Bot-заглушкой на копии той же базы. Апдейты одного пользователя идут
+строго по очереди, как от живого человека, поэтому нажатия не склеиваются.
+
+    python benchmarks/worker_throughput.py --workers 1 2 4 --users 200 --taps 10
+
+cpu ms/upd — процессорное время воркеров на апдейт, failed — апдейты,
+упавшие с ошибкой (например, "database is locked" после busy_timeout).
+Один воркер без задержки Bot API занимает ядро целиком, поэтому прирост
+возможен только при свободных ядрах; каждый воркер прогревает свои кэши,
+а запись в один файл SQLite у всех процессов общая.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common import FIRST_USER_ID, bench_environment, browse, make_bot, seed_database  # noqa: E402
+
+bench_environment()
+logging.basicConfig(level=logging.WARNING)
+# main.py открывает bot.log в текущем каталоге, воркеры наследуют каталог
+os.chdir(tempfile.gettempdir())
+
+import main as app  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+from bot.database.session import dispose_engine, setup_engine  # noqa: E402
+from bot.utils.fsm_storage import create_fsm_storage  # noqa: E402
+from bot.utils.sharding import LEADER_WORKER, UpdateRouter, mp_context, serve_updates, start_workers, stop_workers  # noqa: E402
+
+
+def database_url(path: Path) -> str:
+    return f"sqlite+aiosqlite:///{path}"
+
+
+async def record_updates(path: Path, users: int, taps: int):
+    """Прогоняет сценарии пользователей и возвращает все апдейты в порядке обработки"""
+    await setup_engine(database_url(path))
+    await app.start_services(leader=False)
+    bot = make_bot()
+    storage = create_fsm_storage()
+    dp = app.create_dispatcher(storage)
+    recorded = []
+
+    async def feed(kind, update):
+        recorded.append(update)
+        await dp.feed_raw_update(bot, update)
+
+    await asyncio.gather(*(browse(feed, bot.session, FIRST_USER_ID + idx, taps) for idx in range(users)))
+    await app.stop_services(bot, storage, leader=False)
+    return recorded
+
+
+class FailureCounter(logging.Handler):
+    """Считает апдейты, обработка которых закончилась исключением"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord):
+        if record.getMessage().startswith("Failed to process update"):
+            self.count += 1
+
+
+def run_worker(index: int, updates, url: str, latency: float, reports):
+    """Точка входа процесса-воркера бенчмарка"""
+    asyncio.run(worker_main(index, updates, url, latency, reports))
+
+
+async def worker_main(index: int, updates, url: str, latency: float, reports):
+    await setup_engine(url)
+    # Как в main.py: фоновые задачи и свёртка статистики только в ведущем воркере
+    leader = index == LEADER_WORKER
+    await app.start_services(leader)
+    bot = make_bot(latency)
+    storage = create_fsm_storage()
+    dp = app.create_dispatcher(storage)
+    failures = FailureCounter()
+    logging.getLogger().addHandler(failures)
+    reports.put(("ready", index, time.time(), 0.0, 0))
+    cpu_started = time.process_time()
+    try:
+        await serve_updates(dp, bot, updates)
+        reports.put(("done", index, time.time(), time.process_time() - cpu_started, failures.count))
+    finally:
+        await app.stop_services(bot, storage, leader)
+
+
+async def replay(recorded, workers: int, path: Path, latency: float) -> Tuple[float, float, int]:
+    """
+    Раздаёт записанные апдейты workers воркерам. Возвращает время обработки
+    и суммарное процессорное время воркеров (в секундах) и число упавших апдейтов
+    """
+    reports = mp_context.Queue()
+    processes, queues = start_workers(workers, run_worker, database_url(path), latency, reports)
+    loop = asyncio.get_running_loop()
+    for _ in range(workers):
+        await loop.run_in_executor(None, reports.get)
+
+    router = UpdateRouter(queues)
+    started = time.time()
+    for raw in recorded:
+        update = Update.model_validate(raw)
+        event = update.callback_query or update.message
+        key = event.from_user.id
+        # Без флага порядка: все апдейты пользователя по очереди, как в записи
+        queues[router.worker_for(key)].put((key, update.model_dump_json(exclude_unset=True)))
+    for updates in queues:
+        updates.put(None)
+    finished = [await loop.run_in_executor(None, reports.get) for _ in range(workers)]
+    elapsed = max(report[2] for report in finished) - started
+    cpu = sum(report[3] for report in finished)
+    failed = sum(report[4] for report in finished)
+    await stop_workers(processes, queues)
+    return elapsed, cpu, failed
+
+
+async def run(args):
+    workdir = Path(tempfile.mkdtemp(prefix="bot-bench-"))
+    try:
+        template = workdir / "template.db"
+        await setup_engine(database_url(template))
+        await dispose_engine()
+        seed_database(str(template), args.ads)
+
+        shutil.copy(template, workdir / "record.db")
+        recorded = await record_updates(workdir / "record.db", args.users, args.taps)
+        print(f"Recorded {len(recorded)} updates from {args.users} users, {os.cpu_count()} CPU cores")
+
+        baseline = None
+        print(f"{'workers':>8} {'seconds':>9} {'updates/s':>10} {'speedup':>8} {'cpu ms/upd':>11} {'failed':>7}")
+        for workers in args.workers:
+            path = workdir / f"workers{workers}.db"
+            shutil.copy(template, path)
+            elapsed, cpu, failed = await replay(recorded, workers, path, args.latency)
+            rate = len(recorded) / elapsed
+            baseline = baseline or rate
+            print(
+                f"{workers:>8} {elapsed:>9.2f} {rate:>10.1f} {rate / baseline:>7.2f}x "
+                f"{cpu / len(recorded) * 1000:>11.2f} {failed:>7}"
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Числа воркеров для сравнения")
+    parser.add_argument("--users", type=int, default=200, help="Пользователей в записи")
+    parser.add_argument("--taps", type=int, default=10, help="Нажатий ➡️ на пользователя")
+    parser.add_argument("--ads", type=int, default=500, help="Объявлений в базе")
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа Bot API, сек")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
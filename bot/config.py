@@ -61,14 +61,73 @@ print(f"Загруженные админские ID: {ADMIN_IDS}")
 def init_database_path():
     """
     Создаёт директорию для базы данных, если она не существует.
-    Возвращает URL для подключения к SQLite.
+    Возвращает URL для асинхронного подключения к SQLite (через aiosqlite).
     """
     db_dir = DB_FILE.parent
     db_dir.mkdir(parents=True, exist_ok=True)
-    return f"sqlite:///{DB_FILE}"
+    return f"sqlite+aiosqlite:///{DB_FILE}"
 
 DATABASE_URL = init_database_path()
 
+# Параметры пула соединений с БД (один движок на весь процесс)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # Секунды ожидания свободного соединения
+
 # Дополнительные параметры (можно добавлять по мере необходимости)
+CATALOG_CACHE_TTL = int(os.getenv("CATALOG_CACHE_TTL", "300"))  # Время жизни кэша каталога объявлений в секундах
+VIEW_FLUSH_INTERVAL = float(os.getenv("VIEW_FLUSH_INTERVAL", "5"))  # Как часто записывать накопленные просмотры, сек
+VIEW_FLUSH_MAX_EVENTS = int(os.getenv("VIEW_FLUSH_MAX_EVENTS", "500"))  # Досрочная запись после стольких просмотров
+EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", "5"))  # Как часто записывать журнал показов и кликов, сек
+EVENT_FLUSH_MAX_EVENTS = int(os.getenv("EVENT_FLUSH_MAX_EVENTS", "1000"))  # Досрочная запись журнала после стольких событий
+ROLLUP_INTERVAL = float(os.getenv("ROLLUP_INTERVAL", "60"))  # Как часто пересчитывать дневные свёртки статистики, сек
+STATS_CACHE_TTL = int(os.getenv("STATS_CACHE_TTL", "30"))  # Время жизни снимка админской статистики, сек
+# Листать карусель редактированием одной карточки (editMessageMedia) вместо удаления и новой отправки
+CAROUSEL_EDIT_IN_PLACE = os.getenv("CAROUSEL_EDIT_IN_PLACE", "1").lower() in ("1", "true", "yes")
+CAROUSEL_COALESCE_DELAY = float(os.getenv("CAROUSEL_COALESCE_DELAY", "0.15"))  # Сколько ждать следующего нажатия ⬅️/➡️ перед отрисовкой, сек
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "1000"))  # Сколько готовых карточек объявлений держать в памяти
+# Рассылка уведомлений
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))  # Сообщений в секунду на весь бот (лимит Telegram ~30)
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))  # Одновременных запросов к Bot API
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))  # Повторов при сетевых ошибках и 5xx
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "10"))  # Как часто сообщать о прогрессе, сек
+USER_FLUSH_INTERVAL = float(os.getenv("USER_FLUSH_INTERVAL", "5"))  # Как часто записывать обновления пользователей после рассылки, сек
+USER_FLUSH_MAX_EVENTS = int(os.getenv("USER_FLUSH_MAX_EVENTS", "1000"))  # Досрочная запись после стольких обновлений
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "200"))  # Сколько получателей рассылка забирает из очереди за раз
+NOTIFY_DIGEST_WINDOW = float(os.getenv("NOTIFY_DIGEST_WINDOW", "60"))  # Объявления за это время уходят одним уведомлением, сек
+MAX_SAVED_SEARCHES = int(os.getenv("MAX_SAVED_SEARCHES", "10"))  # Сколько поисков может сохранить один пользователь
+# Присылать все новые объявления пользователям без сохранённых поисков
+NOTIFY_WITHOUT_SEARCH = os.getenv("NOTIFY_WITHOUT_SEARCH", "1").lower() in ("1", "true", "yes")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))  # Воркеров фоновых задач (рассылки всё равно делят общий лимит)
+# Рассылать уведомления и о новых рекламных объявлениях
+NOTIFY_ON_PROMO = os.getenv("NOTIFY_ON_PROMO", "0").lower() in ("1", "true", "yes")
+# Режим получения апдейтов: polling или webhook
+RUN_MODE = os.getenv("RUN_MODE", "polling").lower()
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")  # Адрес, на котором слушает встроенный сервер
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Публичный адрес для setWebhook; пусто — вебхук не регистрируется
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # Проверка заголовка X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "100"))  # Одновременно обрабатываемых апдейтов
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))  # Сколько ждать принятые апдейты при остановке, сек
+# Хранилище состояний FSM: sqlite (общая база, переживает перезапуск), redis или memory
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite").lower()
+FSM_REDIS_URL = os.getenv("FSM_REDIS_URL", "redis://localhost:6379/0")
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "0.5"))  # Как часто записывать изменения FSM в SQLite, сек
+FSM_FLUSH_MAX_EVENTS = int(os.getenv("FSM_FLUSH_MAX_EVENTS", "200"))  # Досрочная запись после стольких изменений
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))  # Сколько пользователей держать в кэше FSM в памяти
+WORKERS = int(os.getenv("WORKERS", "1"))  # Процессов-воркеров; больше одного — режим супервизора, нужен только при нехватке одного ядра
+WORKER_MAX_CONCURRENCY = int(os.getenv("WORKER_MAX_CONCURRENCY", "100"))  # Сколько апдейтов воркер обрабатывает одновременно
+# Ограничение частоты апдейтов от одного пользователя (token bucket): скорость в секунду и запас
+THROTTLE_CAROUSEL_RATE = float(os.getenv("THROTTLE_CAROUSEL_RATE", "3"))  # Листание карусели и фото
+THROTTLE_CAROUSEL_BURST = int(os.getenv("THROTTLE_CAROUSEL_BURST", "6"))
+THROTTLE_COMMANDS_RATE = float(os.getenv("THROTTLE_COMMANDS_RATE", "1"))  # Команды, сообщения и прочие кнопки
+THROTTLE_COMMANDS_BURST = int(os.getenv("THROTTLE_COMMANDS_BURST", "5"))
+THROTTLE_ADMIN_RATE = float(os.getenv("THROTTLE_ADMIN_RATE", "10"))  # Любые апдейты админов (альбомы приходят пачкой)
+THROTTLE_ADMIN_BURST = int(os.getenv("THROTTLE_ADMIN_BURST", "30"))
+PROMO_RATE = float(os.getenv("PROMO_RATE", "0.2"))  # Вероятность показать рекламу при листании вперёд
+PROMO_USER_CAP = int(os.getenv("PROMO_USER_CAP", "2"))  # Сколько раз одна реклама показывается пользователю за окно
+PROMO_CAP_WINDOW = int(os.getenv("PROMO_CAP_WINDOW", "3600"))  # Окно ограничения показов, сек
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "100"))  # Сколько лучших совпадений /search листать в карусели
 MEDIA_GROUP_TIMEOUT = 5  # Таймаут для сбора медиагруппы в секундах
 MAX_PHOTOS_PER_AD = 10   # Максимальное количество фото в одном объявлении
\ No newline at end of file
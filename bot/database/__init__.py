@@ -2,4 +2,5 @@
 Пакет для работы с базой данных.
 Экспортируем основные модели и функции инициализации.
 """
-from .models import Advertisement, Photo, init_db, Base
\ No newline at end of file
+from .models import Advertisement, Photo, init_db, Base
+from .session import setup_engine, get_session, dispose_engine
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""
+Версионные миграции схемы SQLite.
+Номер последней применённой миграции хранится в PRAGMA user_version.
+Новая база создаётся сразу по моделям и помечается последней версией,
+а существующая догоняется миграциями по порядку, каждая в своей транзакции.
+"""
+import logging
+from typing import List, Tuple
+
+from sqlalchemy import inspect, MetaData
+from sqlalchemy.engine import Connection
+
+# Полнотекстовый индекс описаний объявлений (FTS5 с внешним содержимым)
+# и триггеры, которые поддерживают его в актуальном состоянии.
+# Моделей для них нет, поэтому в новой базе они создаются отдельно
+SEARCH_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS advertisements_fts USING fts5("
+    "description, content='advertisements', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS advertisements_fts_insert AFTER INSERT ON advertisements BEGIN "
+    "INSERT INTO advertisements_fts (rowid, description) VALUES (new.id, new.description); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS advertisements_fts_delete AFTER DELETE ON advertisements BEGIN "
+    "INSERT INTO advertisements_fts (advertisements_fts, rowid, description) "
+    "VALUES ('delete', old.id, old.description); "
+    "END",
+    # Только при смене описания: счётчики просмотров обновляются постоянно
+    "CREATE TRIGGER IF NOT EXISTS advertisements_fts_update AFTER UPDATE OF description ON advertisements BEGIN "
+    "INSERT INTO advertisements_fts (advertisements_fts, rowid, description) "
+    "VALUES ('delete', old.id, old.description); "
+    "INSERT INTO advertisements_fts (rowid, description) VALUES (new.id, new.description); "
+    "END",
+]
+
+# (версия, описание, SQL-команды). Уже выпущенные миграции не меняем, только добавляем новые
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "indexes for carousel, photos, notifications and statistics", [
+        "CREATE INDEX IF NOT EXISTS ix_advertisements_promo_created "
+        "ON advertisements (is_promotional, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_advertisements_views_count ON advertisements (views_count)",
+        "CREATE INDEX IF NOT EXISTS ix_advertisements_last_shown ON advertisements (last_shown)",
+        "CREATE INDEX IF NOT EXISTS ix_photos_ad_position ON photos (advertisement_id, position)",
+        "CREATE INDEX IF NOT EXISTS ix_users_notifications_enabled ON users (notifications_enabled)",
+        "CREATE INDEX IF NOT EXISTS ix_notification_outbox_status_user "
+        "ON notification_outbox (status, telegram_id)",
+        "CREATE INDEX IF NOT EXISTS ix_saved_searches_telegram_id ON saved_searches (telegram_id)",
+    ]),
+    (2, "promo rotation weight and impression budget", [
+        "ALTER TABLE advertisements ADD COLUMN promo_weight INTEGER NOT NULL DEFAULT 1",
+        "ALTER TABLE advertisements ADD COLUMN promo_budget INTEGER",
+    ]),
+    (3, "full-text search over ad descriptions", SEARCH_SCHEMA + [
+        # Индексируем уже существующие объявления
+        "INSERT INTO advertisements_fts (advertisements_fts) VALUES ('rebuild')",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(connection: Connection) -> int:
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def _set_schema_version(connection: Connection, version: int):
+    # PRAGMA не принимает параметры, версия — всегда int из MIGRATIONS
+    connection.exec_driver_sql(f"PRAGMA user_version = {int(version)}")
+
+
+def run_migrations(connection: Connection, metadata: MetaData):
+    """
+    Создаёт недостающие таблицы и применяет миграции новее текущей версии.
+    Вызывается синхронно через AsyncConnection.run_sync при старте
+    """
+    is_new_database = not inspect(connection).has_table("advertisements")
+    metadata.create_all(connection)
+    if is_new_database:
+        # Таблицы и индексы только что созданы по актуальным моделям
+        for statement in SEARCH_SCHEMA:
+            connection.exec_driver_sql(statement)
+        _set_schema_version(connection, LATEST_VERSION)
+        connection.commit()
+        logging.info(f"Created database schema version {LATEST_VERSION}")
+        return
+
+    version = get_schema_version(connection)
+    connection.commit()
+    for migration_version, description, statements in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        logging.info(f"Applying migration {migration_version}: {description}")
+        with connection.begin():
+            for statement in statements:
+                connection.exec_driver_sql(statement)
+            _set_schema_version(connection, migration_version)
+    if version < LATEST_VERSION:
+        logging.info(f"Database schema migrated from version {version} to {LATEST_VERSION}")
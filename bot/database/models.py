@@ -1,14 +1,23 @@
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Date, UniqueConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, joinedload
 from sqlalchemy import Boolean
-from sqlalchemy import select, func
+from sqlalchemy import select, func, event
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncAttrs
+from .migrations import run_migrations
 
-Base = declarative_base()
+Base = declarative_base(cls=AsyncAttrs)
 
 class Advertisement(Base):
     __tablename__ = 'advertisements'
+    __table_args__ = (
+        # Карусель: обычные объявления по дате (keyset по created_at, id)
+        Index('ix_advertisements_promo_created', 'is_promotional', 'created_at', 'id'),
+        # Статистика: самое просматриваемое и последнее показанное
+        Index('ix_advertisements_views_count', 'views_count'),
+        Index('ix_advertisements_last_shown', 'last_shown'),
+    )
     
     id = Column(Integer, primary_key=True)
     description = Column(String, nullable=False)
@@ -19,19 +28,28 @@ class Advertisement(Base):
     is_promotional = Column(Boolean, default=False)  # Новое поле для отметки рекламных объявлений
     views_count = Column(Integer, default=0)  # Количество показов
     last_shown = Column(DateTime, nullable=True)  # Время последнего показа
+    promo_weight = Column(Integer, nullable=False, default=1, server_default="1")  # Вес рекламы в ротации
+    promo_budget = Column(Integer, nullable=True)  # Лимит показов рекламы, None — без лимита
     
-    # Связь с фотографиями
-    photos = relationship("Photo", back_populates="advertisement", cascade="all, delete-orphan")
+    # Связь с фотографиями, всегда в порядке показа
+    photos = relationship("Photo", back_populates="advertisement", cascade="all, delete-orphan",
+                          order_by="Photo.position")
 
     @classmethod
-    def get_next_regular_id(cls, session):
+    async def get_next_regular_id(cls, session):
         """Получает следующий ID для обычного объявления"""
         # Находим максимальный ID среди обычных объявлений
-        max_regular_id = session.query(func.max(cls.id)).filter(cls.id < 900000).scalar() or 0
+        max_regular_id = await session.scalar(select(func.max(cls.id)).where(cls.id < 900000)) or 0
         return max_regular_id + 1
 
+    @classmethod
+    async def get_with_photos(cls, session, ad_id: int):
+        """Получает объявление вместе с упорядоченными фото одним запросом"""
+        return await session.get(cls, ad_id, options=[joinedload(cls.photos)])
+
 class Photo(Base):
     __tablename__ = 'photos'
+    __table_args__ = (Index('ix_photos_ad_position', 'advertisement_id', 'position'),)
     
     id = Column(Integer, primary_key=True)
     advertisement_id = Column(Integer, ForeignKey('advertisements.id'))
@@ -43,6 +61,7 @@ class Photo(Base):
 
 class User(Base):
     __tablename__ = 'users'
+    __table_args__ = (Index('ix_users_notifications_enabled', 'notifications_enabled'),)
     
     id = Column(Integer, primary_key=True)
     telegram_id = Column(Integer, unique=True, nullable=False)
@@ -53,12 +72,110 @@ class User(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     last_activity = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+class SavedSearch(Base):
+    """Сохранённый поиск: уведомления приходят только о подходящих объявлениях"""
+    __tablename__ = 'saved_searches'
+
+    id = Column(Integer, primary_key=True)
+    telegram_id = Column(Integer, nullable=False, index=True)
+    min_price = Column(Integer, nullable=True)
+    max_price = Column(Integer, nullable=True)
+    keywords = Column(String, nullable=True)  # Слова через пробел в нижнем регистре, нужны все
+    include_promo = Column(Boolean, default=True)  # False — не присылать рекламу по этому поиску
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class AdEvent(Base):
+    """Журнал показов и кликов "Арендовать". Только дописывается, не изменяется"""
+    __tablename__ = 'ad_events'
+
+    id = Column(Integer, primary_key=True)
+    ad_id = Column(Integer, nullable=False)  # Без FK: журнал переживает удаление объявления
+    telegram_id = Column(Integer, nullable=False)
+    event_type = Column(String, nullable=False)  # 'view' или 'rent'
+    is_promotional = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class AdDailyStats(Base):
+    """Свёртка журнала событий: показы и клики по каждому объявлению за день"""
+    __tablename__ = 'ad_daily_stats'
+
+    ad_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    is_promotional = Column(Boolean, default=False)
+    views = Column(Integer, default=0)
+    rent_clicks = Column(Integer, default=0)
+
+class DailyStats(Base):
+    """Свёртка журнала событий: итоги за день отдельно по обычным объявлениям и рекламе"""
+    __tablename__ = 'daily_stats'
+
+    day = Column(Date, primary_key=True)
+    is_promotional = Column(Boolean, primary_key=True)
+    views = Column(Integer, default=0)
+    rent_clicks = Column(Integer, default=0)
+
+class RollupState(Base):
+    """ID последнего события журнала, уже учтённого в свёртках"""
+    __tablename__ = 'rollup_state'
+
+    name = Column(String, primary_key=True)
+    last_event_id = Column(Integer, default=0)
+
+class MediaFile(Base):
+    """Telegram file_id локального файла, загруженного ботом, по хэшу содержимого"""
+    __tablename__ = 'media_files'
+
+    content_hash = Column(String, primary_key=True)  # sha256 содержимого файла
+    file_id = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class NotificationOutbox(Base):
+    """Очередь уведомлений о новых объявлениях: одна строка на пару объявление-пользователь"""
+    __tablename__ = 'notification_outbox'
+    __table_args__ = (
+        UniqueConstraint('ad_id', 'telegram_id'),
+        Index('ix_notification_outbox_status_user', 'status', 'telegram_id'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    ad_id = Column(Integer, nullable=False)
+    telegram_id = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default='pending')  # pending, sending, sent, blocked, failed
+    attempts = Column(Integer, default=0)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class FsmRecord(Base):
+    """Состояние FSM и его данные (JSON) для одного ключа aiogram"""
+    __tablename__ = 'fsm_storage'
+
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(String, nullable=False, default='{}')
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 def generate_promo_id() -> int:
     """Генерирует ID для рекламного объявления, начинающийся с 9"""
     return int('9' + str(int(datetime.utcnow().timestamp()))[-6:])
 
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL позволяет читать базу, пока другое соединение пишет в неё"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
 # Функция для инициализации БД
-def init_db(database_url: str):
-    engine = create_engine(database_url)
-    Base.metadata.create_all(engine)
+async def init_db(database_url: str, **engine_kwargs) -> AsyncEngine:
+    """
+    Создаёт асинхронный движок, таблицы и применяет миграции схемы.
+    Дополнительные параметры (размер пула и т.п.) передаются в create_async_engine.
+    """
+    engine = create_async_engine(database_url, **engine_kwargs)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+    async with engine.connect() as conn:
+        await conn.run_sync(run_migrations, Base.metadata)
     return engine
\ No newline at end of file
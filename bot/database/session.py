@@ -0,0 +1,51 @@
+"""
+Единый асинхронный движок БД и фабрика сессий на весь процесс.
+Движок создаётся один раз при старте бота, а не на каждый апдейт.
+"""
+import logging
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from .models import init_db
+from ..config import DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT
+
+_engine: Optional[AsyncEngine] = None
+_session_factory: Optional[async_sessionmaker] = None
+
+
+async def setup_engine(database_url: str = DATABASE_URL) -> AsyncEngine:
+    """
+    Создаёт движок с пулом соединений и фабрику сессий.
+    Повторный вызов возвращает уже созданный движок.
+    """
+    global _engine, _session_factory
+    if _engine is None:
+        _engine = await init_db(
+            database_url,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+        # expire_on_commit=False: после commit объекты остаются доступны
+        # без ленивой подгрузки, которая в асинхронном режиме невозможна
+        _session_factory = async_sessionmaker(_engine, expire_on_commit=False)
+        logging.info(f"Database engine initialized (pool_size={DB_POOL_SIZE}, max_overflow={DB_MAX_OVERFLOW})")
+    return _engine
+
+
+def get_session() -> AsyncSession:
+    """Возвращает новую асинхронную сессию из общего пула"""
+    if _session_factory is None:
+        raise RuntimeError("Database engine is not initialized, call setup_engine() first")
+    return _session_factory()
+
+
+async def dispose_engine():
+    """Закрывает все соединения пула при остановке бота"""
+    global _engine, _session_factory
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+        _session_factory = None
+        logging.info("Database engine disposed")
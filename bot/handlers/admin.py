@@ -3,17 +3,22 @@ from aiogram.filters import Command, StateFilter
 from aiogram.types import Message, CallbackQuery, InputMediaPhoto
 from aiogram.fsm.context import FSMContext
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
-from sqlalchemy.orm import Session
-from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete
 from datetime import datetime
 
 from ..database.models import Advertisement, Photo
 from ..keyboards import admin_kb
 from ..utils.states import AdminStates, EditStates
-from ..config import ADMIN_IDS
+from ..config import ADMIN_IDS, NOTIFY_ON_PROMO
 from .user import cmd_start
-from ..utils.notifications import notify_new_ad
+from ..utils.notifications import notification_digest
+from ..utils.outbox import fill_outbox
 from ..database.models import generate_promo_id
+from ..utils.catalog import catalog
+from ..utils.stats import stats_cache
+from ..utils.promo import promo_scheduler
+from ..utils.render_stats import render_stats
 
 router = Router()
 
@@ -89,7 +94,7 @@ async def process_price(message: Message, state: FSMContext):
 
 # Приём ссылки на менеджера и предпросмотр
 @router.message(AdminStates.waiting_for_manager)
-async def process_manager_link(message: Message, state: FSMContext, session: Session):
+async def process_manager_link(message: Message, state: FSMContext, session: AsyncSession):
     """Сохраняем ссылку на менеджера и показываем предпросмотр объявления"""
     await state.update_data(manager_link=message.text)
     data = await state.get_data()
@@ -131,9 +136,9 @@ async def process_manager_link(message: Message, state: FSMContext, session: Ses
 
 # Редактирование объявлений
 @router.message(F.text == "📝 Редактировать объявление")
-async def list_ads_for_edit(message: Message, session: Session):
+async def list_ads_for_edit(message: Message, session: AsyncSession):
     """Показываем список объявлений для редактирования"""
-    ads = session.scalars(select(Advertisement).order_by(Advertisement.created_at.desc())).all()
+    ads = (await session.scalars(select(Advertisement).order_by(Advertisement.created_at.desc()))).all()
     
     if not ads:
         await message.answer("❌ Нет доступных объявлений для редактирования!")
@@ -153,21 +158,29 @@ async def list_ads_for_edit(message: Message, session: Session):
 
 # Обработка выбора объявления для редактирования
 @router.callback_query(F.data.startswith("edit_ad_"))
-async def show_edit_options(callback: CallbackQuery, session: Session):
+async def show_edit_options(callback: CallbackQuery, session: AsyncSession):
     """Показываем опции редактирования для выбранного объявления"""
     ad_id = int(callback.data.split('_')[2])
-    ad = session.get(Advertisement, ad_id)
+    ad = await session.get(Advertisement, ad_id)
     
     if not ad:
         await callback.answer("❌ Объявление не найдено!")
         return
 
-    await callback.message.edit_text(
+    text = (
         f"🔧 Редактирование объявления ID{ad.id}\n"
         f"Текущее описание: {ad.description[:100]}...\n"
-        f"Текущая цена: {ad.price}\n\n"
-        "Выберите, что хотите изменить:",
-        reply_markup=admin_kb.get_edit_ad_kb(ad_id)
+        f"Текущая цена: {ad.price}\n"
+    )
+    if ad.is_promotional:
+        budget = ad.promo_budget if ad.promo_budget is not None else "без лимита"
+        text += (
+            f"⚖️ Вес в ротации: {ad.promo_weight}\n"
+            f"🎯 Лимит показов: {budget} (показано {ad.views_count or 0})\n"
+        )
+    await callback.message.edit_text(
+        text + "\nВыберите, что хотите изменить:",
+        reply_markup=admin_kb.get_edit_ad_kb(ad_id, ad.is_promotional)
     )
 
 # Обработчики для каждого типа редактирования
@@ -183,15 +196,23 @@ async def start_edit_photos(callback: CallbackQuery, state: FSMContext):
         reply_markup=admin_kb.get_photo_upload_kb()
     )
 
+async def schedule_ad_notification(bot, message: Message):
+    """
+    Планирует рассылку о новом объявлении и заводит статусное сообщение.
+    Объявления, опубликованные подряд, уходят пользователям одним уведомлением
+    """
+    status = await message.answer("📨 Уведомление о новом объявлении поставлено в рассылку...")
+    notification_digest.schedule(bot, status.chat.id, status.message_id)
+
 # Подтверждение создания
 @router.callback_query(AdminStates.confirm_creation, F.data == "confirm")
-async def confirm_creation(callback: CallbackQuery, state: FSMContext, session: Session):
+async def confirm_creation(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
 
     if 'is_promotional' in data and data['is_promotional']:
         ad_id = generate_promo_id()
     else:
-        ad_id = Advertisement.get_next_regular_id(session)
+        ad_id = await Advertisement.get_next_regular_id(session)
     
     # Создаём объявление
     ad = Advertisement(
@@ -201,7 +222,7 @@ async def confirm_creation(callback: CallbackQuery, state: FSMContext, session:
         manager_link=data["manager_link"]
     )
     session.add(ad)
-    session.flush()
+    await session.flush()
     
     # Добавляем фотки
     for idx, photo_id in enumerate(data["photos"]):
@@ -211,17 +232,20 @@ async def confirm_creation(callback: CallbackQuery, state: FSMContext, session:
             position=idx
         )
         session.add(photo)
+    # Получатели уведомлений записываются в той же транзакции, что и объявление
+    await fill_outbox(session, ad)
     
-    session.commit()
-
-     # Отправляем уведомления о новом объявлении
-    await notify_new_ad(callback.bot, session, ad)
-    
-    await state.clear()
+    await session.commit()
+    catalog.invalidate()
+    stats_cache.invalidate()
+    # Сразу отвечаем на callback, рассылка пойдёт в фоне
+    await callback.answer("Объявление сохранено")
     
     await state.clear()
     # Отправляем новое сообщение вместо редактирования
     await callback.message.answer("✅ Объявление успешно создано!")
+    # Отправляем уведомления о новом объявлении
+    await schedule_ad_notification(callback.bot, callback.message)
     # Удаляем предыдущее сообщение с предпросмотром
     await callback.message.delete()
     # Возвращаемся в админку
@@ -237,9 +261,9 @@ async def cancel_creation(callback: CallbackQuery, state: FSMContext):
 
 # Удаление объявлений
 @router.message(F.text == "❌ Удалить объявление")
-async def list_ads_for_delete(message: Message, session: Session):
+async def list_ads_for_delete(message: Message, session: AsyncSession):
     """Показываем список объявлений для удаления"""
-    ads = session.scalars(select(Advertisement).order_by(Advertisement.created_at.desc())).all()
+    ads = (await session.scalars(select(Advertisement).order_by(Advertisement.created_at.desc()))).all()
     
     if not ads:
         await message.answer("❌ Нет доступных объявлений для удаления!")
@@ -254,10 +278,10 @@ async def list_ads_for_delete(message: Message, session: Session):
 
 # Подтверждение удаления
 @router.callback_query(F.data.startswith("delete_ad_"))
-async def confirm_delete_ad(callback: CallbackQuery, session: Session):
+async def confirm_delete_ad(callback: CallbackQuery, session: AsyncSession):
     """Запрашиваем подтверждение удаления"""
     ad_id = int(callback.data.split('_')[2])
-    ad = session.get(Advertisement, ad_id)
+    ad = await session.get(Advertisement, ad_id)
     
     if not ad:
         await callback.answer("❌ Объявление не найдено!")
@@ -272,83 +296,72 @@ async def confirm_delete_ad(callback: CallbackQuery, session: Session):
 
 # Финальное удаление
 @router.callback_query(F.data.startswith("confirm_delete_"))
-async def delete_ad(callback: CallbackQuery, session: Session):
+async def delete_ad(callback: CallbackQuery, session: AsyncSession):
     """Удаляем объявление из базы"""
     ad_id = int(callback.data.split('_')[2])
-    ad = session.get(Advertisement, ad_id)
+    ad = await session.get(Advertisement, ad_id)
     
     if ad:
-        session.delete(ad)
-        session.commit()
+        is_promotional = ad.is_promotional
+        await session.delete(ad)
+        await session.commit()
+        catalog.invalidate()
+        stats_cache.invalidate()
+        if is_promotional:
+            promo_scheduler.remove(ad_id)
         await callback.message.edit_text("✅ Объявление успешно удалено!")
     else:
         await callback.answer("❌ Объявление не найдено!")
 
 # Статистика
 @router.message(F.text == "📊 Статистика")
-async def show_statistics(message: Message, session: Session):
+async def show_statistics(message: Message, session: AsyncSession):
     """Показываем расширенную статистику по объявлениям"""
     
-    # Базовая статистика
-    total_ads = session.scalar(select(func.count()).select_from(Advertisement))
-    total_photos = session.scalar(select(func.count()).select_from(Photo))
-    
-    # Статистика по рекламным объявлениям
-    promo_ads = session.scalar(
-        select(func.count())
-        .select_from(Advertisement)
-        .where(Advertisement.is_promotional == True)  # noqa: E712
-    )
-    
-    # Общее количество просмотров всех объявлений
-    total_views = session.scalar(
-        select(func.sum(Advertisement.views_count))
-        .select_from(Advertisement)
-    ) or 0
-    
-    # Статистика по рекламным объявлениям
-    promo_views = session.scalar(
-        select(func.sum(Advertisement.views_count))
-        .select_from(Advertisement)
-        .where(Advertisement.is_promotional == True)  # noqa: E712
-    ) or 0
-    
-    # Самое просматриваемое объявление
-    most_viewed = session.scalar(
-        select(Advertisement)
-        .order_by(Advertisement.views_count.desc())
-        .limit(1)
-    )
-    
-    # Последнее просмотренное объявление
-    last_viewed = session.scalar(
-        select(Advertisement)
-        .where(Advertisement.last_shown.isnot(None))
-        .order_by(Advertisement.last_shown.desc())
-        .limit(1)
-    )
+    # Все счётчики берём из снимка, который пересчитывается не чаще раза в STATS_CACHE_TTL
+    stats = await stats_cache.get(session)
 
     stats_text = (
         "📊 Статистика бота:\n\n"
-        f"📝 Всего объявлений: {total_ads}\n"
-        f"📸 Всего фотографий: {total_photos}\n"
-        f"👁 Всего просмотров: {total_views}\n\n"
-        f"📢 Рекламных объявлений: {promo_ads}\n"
-        f"👀 Просмотров рекламы: {promo_views}\n\n"
+        f"📝 Всего объявлений: {stats['total_ads']}\n"
+        f"📸 Всего фотографий: {stats['total_photos']}\n"
+        f"👁 Всего просмотров: {stats['total_views']}\n\n"
+        f"📢 Рекламных объявлений: {stats['promo_ads']}\n"
+        f"👀 Просмотров рекламы: {stats['promo_views']}\n\n"
     )
     
-    if most_viewed:
+    if stats["most_viewed_id"] is not None:
         stats_text += (
             f"🏆 Самое просматриваемое:\n"
-            f"ID{most_viewed.id}: {most_viewed.description[:50]}...\n"
-            f"Просмотров: {most_viewed.views_count}\n\n"
+            f"ID{stats['most_viewed_id']}: {stats['most_viewed_description'][:50]}...\n"
+            f"Просмотров: {stats['most_viewed_views']}\n\n"
         )
     
-    if last_viewed:
+    if stats["last_viewed_id"] is not None:
         stats_text += (
             f"🕒 Последний просмотр:\n"
-            f"ID{last_viewed.id} в {last_viewed.last_shown.strftime('%H:%M %d.%m.%Y')}\n"
+            f"ID{stats['last_viewed_id']} в {stats['last_viewed_at'].strftime('%H:%M %d.%m.%Y')}\n"
         )
+
+    # Показы и клики за период берём из дневных свёрток журнала событий
+    for title, days in (("Сегодня", 1), ("За 7 дней", 7)):
+        summary = stats["periods"][days]
+        conversion = summary["rent_clicks"] / summary["views"] * 100 if summary["views"] else 0
+        stats_text += (
+            f"\n📅 {title}:\n"
+            f"👁 Просмотров объявлений: {summary['views']}\n"
+            f"👀 Просмотров рекламы: {summary['promo_views']}\n"
+            f"📞 Нажатий \"Арендовать\": {summary['rent_clicks']} ({conversion:.1f}%)\n"
+        )
+
+    top_promo = stats["top_promo"]
+    if top_promo:
+        stats_text += f"\n📢 Топ рекламы за 7 дней: ID{top_promo.ad_id} ({top_promo.views} показов)\n"
+
+    if render_stats.navigations:
+        stats_text += f"\n🖼 Вызовов Bot API на переход по карусели: {render_stats.average:.2f}\n"
+
+    stats_text += f"\n🔄 Обновлено в {stats['collected_at'].strftime('%H:%M:%S')}"
     
     await message.answer(stats_text)
 
@@ -363,7 +376,7 @@ async def cancel_action(message: Message, state: FSMContext):
     await admin_panel(message)
 
 @router.message(F.text == "🔙 Выход")
-async def exit_admin(message: Message, session: Session):  # Добавляем параметр session
+async def exit_admin(message: Message, session: AsyncSession):  # Добавляем параметр session
     """Выход из админ-панели"""
     await message.answer(
         "👋 Выход из панели администратора", 
@@ -381,7 +394,7 @@ async def process_edit_photos(message: Message, state: FSMContext):
     await message.answer(f"✅ Фото #{len(photos)} загружено! Отправьте ещё или нажмите 'Готово'")
 
 @router.message(EditStates.edit_photos, F.text == "Готово")
-async def save_edited_photos(message: Message, state: FSMContext, session: Session):
+async def save_edited_photos(message: Message, state: FSMContext, session: AsyncSession):
     """Сохранение отредактированных фото"""
     data = await state.get_data()
     if not data.get("new_photos"):
@@ -389,10 +402,13 @@ async def save_edited_photos(message: Message, state: FSMContext, session: Sessi
         return
         
     ad_id = data["editing_ad_id"]
-    ad = session.get(Advertisement, ad_id)
+    ad = await session.get(Advertisement, ad_id)
+    if ad:
+        # Фото входят в карточку объявления, поэтому меняем и время обновления
+        ad.updated_at = datetime.utcnow()
     
     # Удаляем старые фото
-    session.query(Photo).filter(Photo.advertisement_id == ad_id).delete()
+    await session.execute(delete(Photo).where(Photo.advertisement_id == ad_id))
     
     # Добавляем новые
     for idx, photo_id in enumerate(data["new_photos"]):
@@ -403,7 +419,9 @@ async def save_edited_photos(message: Message, state: FSMContext, session: Sessi
         )
         session.add(photo)
         
-    session.commit()
+    await session.commit()
+    catalog.invalidate()
+    stats_cache.invalidate()
     await state.clear()
     await message.answer(
         "✅ Фотографии успешно обновлены!", 
@@ -427,15 +445,17 @@ async def start_edit_description(callback: CallbackQuery, state: FSMContext):
     )
 
 @router.message(EditStates.edit_description)
-async def save_edited_description(message: Message, state: FSMContext, session: Session):
+async def save_edited_description(message: Message, state: FSMContext, session: AsyncSession):
     """Сохраняем новое описание"""
     data = await state.get_data()
     ad_id = data["editing_ad_id"]
-    ad = session.get(Advertisement, ad_id)
+    ad = await session.get(Advertisement, ad_id)
     
     if ad:
         ad.description = message.text
-        session.commit()
+        await session.commit()
+        catalog.invalidate()
+        stats_cache.invalidate()
         await state.clear()
         await message.answer(
             "✅ Описание успешно обновлено!", 
@@ -459,15 +479,17 @@ async def start_edit_price(callback: CallbackQuery, state: FSMContext):
     )
 
 @router.message(EditStates.edit_price)
-async def save_edited_price(message: Message, state: FSMContext, session: Session):
+async def save_edited_price(message: Message, state: FSMContext, session: AsyncSession):
     """Сохраняем новую цену"""
     data = await state.get_data()
     ad_id = data["editing_ad_id"]
-    ad = session.get(Advertisement, ad_id)
+    ad = await session.get(Advertisement, ad_id)
     
     if ad:
         ad.price = message.text
-        session.commit()
+        await session.commit()
+        catalog.invalidate()
+        stats_cache.invalidate()
         await state.clear()
         await message.answer(
             "✅ Цена успешно обновлена!", 
@@ -491,15 +513,17 @@ async def start_edit_manager(callback: CallbackQuery, state: FSMContext):
     )
 
 @router.message(EditStates.edit_manager)
-async def save_edited_manager(message: Message, state: FSMContext, session: Session):
+async def save_edited_manager(message: Message, state: FSMContext, session: AsyncSession):
     """Сохраняем новую ссылку на менеджера"""
     data = await state.get_data()
     ad_id = data["editing_ad_id"]
-    ad = session.get(Advertisement, ad_id)
+    ad = await session.get(Advertisement, ad_id)
     
     if ad:
         ad.manager_link = message.text
-        session.commit()
+        await session.commit()
+        catalog.invalidate()
+        stats_cache.invalidate()
         await state.clear()
         await message.answer(
             "✅ Контакт менеджера успешно обновлен!", 
@@ -507,6 +531,77 @@ async def save_edited_manager(message: Message, state: FSMContext, session: Sess
         )
         await admin_panel(message)
 
+@router.callback_query(F.data.startswith("edit_weight_"))
+async def start_edit_weight(callback: CallbackQuery, state: FSMContext):
+    """Начинаем редактирование веса рекламы"""
+    ad_id = int(callback.data.split('_')[2])
+    await state.update_data(editing_ad_id=ad_id)
+    await state.set_state(EditStates.edit_weight)
+    
+    await callback.message.answer(
+        "⚖️ Укажите вес рекламы в ротации (целое число, 0 — не показывать).\n"
+        "Реклама с весом 2 показывается вдвое чаще рекламы с весом 1:",
+        reply_markup=ReplyKeyboardMarkup(
+            keyboard=[[KeyboardButton(text="Отмена")]], 
+            resize_keyboard=True
+        )
+    )
+
+@router.message(EditStates.edit_weight)
+async def save_edited_weight(message: Message, state: FSMContext, session: AsyncSession):
+    """Сохраняем новый вес рекламы"""
+    if not (message.text or "").isdigit():
+        await message.answer("❌ Вес должен быть целым числом, попробуйте ещё раз")
+        return
+    data = await state.get_data()
+    ad = await session.get(Advertisement, data["editing_ad_id"])
+    
+    if ad:
+        ad.promo_weight = int(message.text)
+        await session.commit()
+        promo_scheduler.update(ad)
+        await state.clear()
+        await message.answer(
+            "✅ Вес рекламы обновлён!", 
+            reply_markup=ReplyKeyboardRemove()
+        )
+        await admin_panel(message)
+
+@router.callback_query(F.data.startswith("edit_budget_"))
+async def start_edit_budget(callback: CallbackQuery, state: FSMContext):
+    """Начинаем редактирование лимита показов рекламы"""
+    ad_id = int(callback.data.split('_')[2])
+    await state.update_data(editing_ad_id=ad_id)
+    await state.set_state(EditStates.edit_budget)
+    
+    await callback.message.answer(
+        "🎯 Укажите, сколько всего раз показать рекламу (0 — без лимита):",
+        reply_markup=ReplyKeyboardMarkup(
+            keyboard=[[KeyboardButton(text="Отмена")]], 
+            resize_keyboard=True
+        )
+    )
+
+@router.message(EditStates.edit_budget)
+async def save_edited_budget(message: Message, state: FSMContext, session: AsyncSession):
+    """Сохраняем новый лимит показов рекламы"""
+    if not (message.text or "").isdigit():
+        await message.answer("❌ Лимит должен быть целым числом, попробуйте ещё раз")
+        return
+    data = await state.get_data()
+    ad = await session.get(Advertisement, data["editing_ad_id"])
+    
+    if ad:
+        ad.promo_budget = int(message.text) or None
+        await session.commit()
+        promo_scheduler.update(ad)
+        await state.clear()
+        await message.answer(
+            "✅ Лимит показов обновлён!", 
+            reply_markup=ReplyKeyboardRemove()
+        )
+        await admin_panel(message)
+
 @router.callback_query(F.data == "back_to_admin")
 async def back_to_admin(callback: CallbackQuery, state: FSMContext):
     """Возврат в главное меню админки"""
@@ -552,7 +647,7 @@ async def promo_photos_uploaded(message: Message, state: FSMContext):
     )
 
 @router.message(AdminStates.waiting_for_promo_content)
-async def process_promo_content(message: Message, state: FSMContext, session: Session):
+async def process_promo_content(message: Message, state: FSMContext, session: AsyncSession):
     """Обработка контента рекламного объявления и его сохранение"""
     data = await state.get_data()
     
@@ -578,9 +673,17 @@ async def process_promo_content(message: Message, state: FSMContext, session: Se
         )
         session.add(photo)
     
+    if NOTIFY_ON_PROMO:
+        await fill_outbox(session, ad)
+    
     # Сохраняем изменения
-    session.commit()
+    await session.commit()
+    catalog.invalidate()
+    stats_cache.invalidate()
+    promo_scheduler.update(ad)
     
     await message.answer("✅ Рекламное объявление успешно создано!")
+    if NOTIFY_ON_PROMO:
+        await schedule_ad_notification(message.bot, message)
     await state.clear()
     await admin_panel(message)
\ No newline at end of file
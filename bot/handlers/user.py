@@ -1,54 +1,79 @@
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery, InputMediaPhoto
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
-from datetime import datetime
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from pathlib import Path
 from aiogram.types import FSInputFile
+from aiogram.exceptions import TelegramBadRequest
 import logging
-import random
 from sqlalchemy import or_
 from aiogram.fsm.context import FSMContext
 from ..utils.states import UserStates
+from ..utils.catalog import catalog
+from ..utils.view_counter import view_counter
+from ..utils.analytics import event_log, EVENT_VIEW, EVENT_RENT
+from ..utils.render_stats import render_stats
+from ..utils.render_cache import render_cache
+from ..utils.media_registry import media_registry
+from ..utils.pagination import Cursor, decode_cursor, encode_cursor, fetch_neighbours
+from ..utils.coalescing import navigation_coalescer
+from ..utils.promo import promo_scheduler
+from ..utils.search import search_ads
+from ..utils.subscriptions import subscription_index, parse_search_query, describe_search
 
 
 from ..database.models import Advertisement, Photo
 from ..keyboards import user_kb
 from ..utils import messages
-from ..database.models import User
-from ..config import WELCOME_IMAGE
+from ..database.models import User, SavedSearch
+from ..config import WELCOME_IMAGE, CAROUSEL_EDIT_IN_PLACE, MAX_SAVED_SEARCHES
 
 
 router = Router()
 
 @router.message(Command("start"))
-async def cmd_start(message: Message, session: Session):
+async def cmd_start(message: Message, session: AsyncSession):
     """
     Обработчик команды /start
     Регистрирует пользователя и показывает приветственное сообщение с картинкой
     """
-    # Сохраняем информацию о пользователе
-    user = session.query(User).filter(User.telegram_id == message.from_user.id).first()
-    if not user:
-        user = User(
-            telegram_id=message.from_user.id,
-            username=message.from_user.username,
-            first_name=message.from_user.first_name,
-            last_name=message.from_user.last_name
+    # Сохраняем информацию о пользователе. Чтение и запись — в разных транзакциях:
+    # при нескольких воркерах SQLite не даёт читающей транзакции перейти к записи,
+    # если другой процесс успел записать в базу, и сразу отвечает "database is locked"
+    known = await session.scalar(select(User.id).where(User.telegram_id == message.from_user.id))
+    await session.commit()
+    if known is None:
+        await session.execute(
+            sqlite_insert(User.__table__)
+            .values(
+                telegram_id=message.from_user.id,
+                username=message.from_user.username,
+                first_name=message.from_user.first_name,
+                last_name=message.from_user.last_name
+            )
+            .on_conflict_do_nothing(index_elements=["telegram_id"])
         )
-        session.add(user)
-        session.commit()
+        await session.commit()
     
+    file_id = None
     try:
         # Проверяем существование картинки
         if Path(WELCOME_IMAGE).exists():
-            # Отправляем картинку с подписью
-            await message.answer_photo(
-                photo=FSInputFile(WELCOME_IMAGE),
+            # Картинка загружается в Telegram один раз, дальше отправляем её по file_id
+            file_id = await media_registry.get_file_id(session, WELCOME_IMAGE)
+            # Закрываем читающую транзакцию до загрузки картинки, чтобы запись
+            # file_id после неё не упёрлась в устаревший снимок базы
+            await session.commit()
+            sent = await message.answer_photo(
+                photo=file_id or FSInputFile(WELCOME_IMAGE),
                 caption=messages.WELCOME_MESSAGE,
                 reply_markup=user_kb.get_start_kb()
             )
+            if file_id is None:
+                await media_registry.remember(session, WELCOME_IMAGE, sent.photo[-1].file_id)
+                await session.commit()
         else:
             # Если картинки нет, отправляем просто текст
             await message.answer(
@@ -57,6 +82,10 @@ async def cmd_start(message: Message, session: Session):
             )
     except Exception as e:
         logging.error(f"Ошибка при отправке приветственного сообщения: {e}")
+        if file_id is not None:
+            # Сохранённый file_id мог устареть, в следующий раз загрузим картинку заново
+            await media_registry.forget(session, WELCOME_IMAGE)
+            await session.commit()
         # В случае ошибки отправляем сообщение без картинки
         await message.answer(
             messages.WELCOME_MESSAGE,
@@ -65,16 +94,15 @@ async def cmd_start(message: Message, session: Session):
 
 
 @router.callback_query(F.data == "show_ads")
-async def show_first_ad(callback: CallbackQuery, session: Session, state: FSMContext):
+async def show_first_ad(callback: CallbackQuery, session: AsyncSession, state: FSMContext):
     """
     Показывает первое доступное объявление
     Добавляет кнопки навигации и контакта с менеджером
     """
-    # Получаем только обычные объявления
-    query = select(Advertisement).where(Advertisement.is_promotional == False).order_by(Advertisement.created_at.desc())
-    ads = session.scalars(query).all()
+    # Берём только обычные объявления из кэша каталога
+    ads_catalog, ad = await load_first_ad(session)
     
-    if not ads:
+    if ad is None:
         await callback.message.delete()
         await callback.message.answer(
             messages.NO_ADS_MESSAGE,
@@ -85,92 +113,109 @@ async def show_first_ad(callback: CallbackQuery, session: Session, state: FSMCon
     # Показываем первое объявление
     await show_advertisement(
         callback.message,
-        ads[0],
+        ad,
         session,
         current_position=1,
-        total_ads=len(ads),
+        total_ads=ads_catalog.regular_count,
         edit=True
     )
 
-    # Переходим в состояние просмотра объявлений и сохраняем текущий индекс
-    # Первый элемент в списке ads соответствует индексу 0
+    render_cache.warm_next(Cursor(ad.created_at, ad.id, 1), ads_catalog.regular_count)
+
+    # Переходим в состояние просмотра объявлений,
+    # текущая позиция хранится в курсоре кнопок навигации
     await state.set_state(UserStates.viewing_ads)
-    await state.update_data(current_index=0, total_ads=len(ads))
 
-async def show_advertisement(message, ad, session, current_position, total_ads, edit=False):
+async def load_first_ad(session):
+    """
+    Каталог и первое обычное объявление (None, если объявлений нет).
+    Если объявление удалили, а кэш каталога ещё не устарел,
+    каталог перечитывается один раз
+    """
+    ads_catalog = await catalog.load(session)
+    if not ads_catalog.regular_ids:
+        return ads_catalog, None
+    ad = await Advertisement.get_with_photos(session, ads_catalog.regular_ids[0])
+    if ad is None:
+        # Объявление удалили в другом воркере или в обход бота
+        catalog.invalidate()
+        ads_catalog = await catalog.load(session)
+        if ads_catalog.regular_ids:
+            ad = await Advertisement.get_with_photos(session, ads_catalog.regular_ids[0])
+    return ads_catalog, ad
+
+async def show_advertisement(message, ad, session, current_position, total_ads, edit=False, cursor=None,
+                             search=False, keep_message=False):
     """
     Вспомогательная функция для отображения объявления.
-    Загружает фотографии, формирует описание и добавляет кнопки навигации.
-    Использует реальный ad.id для корректной навигации.
+    Берёт готовую карточку (подпись, фото, клавиатуры) из кэша отрисовки.
+    cursor — keyset-курсор для кнопок навигации; для обычного объявления
+    по умолчанию строится из него самого, рекламе передаётся курсор карусели.
+    search — карточка из результатов /search, cursor тогда позиция в результатах.
+    keep_message — не удалять message, если оно не карточка (например, уведомление).
     """
+    if cursor is None and not ad.is_promotional:
+        cursor = encode_cursor(ad, current_position)
 
-    # Увеличиваем счетчик просмотров
-    ad.views_count += 1
-    ad.last_shown = datetime.utcnow()
-    session.commit()
+    # Учитываем просмотр в буфере, в БД он попадёт пакетной записью
+    view_counter.add(ad.id)
+    event_log.add(ad.id, message.chat.id, EVENT_VIEW, ad.is_promotional)
 
-    # Получаем все фото объявления, отсортированные по позиции
-    photos = session.scalars(
-        select(Photo)
-        .where(Photo.advertisement_id == ad.id)
-        .order_by(Photo.position)
-    ).all()
+    # Подпись, медиа и клавиатуры строятся один раз на версию объявления
+    rendered = await render_cache.render(ad)
+    navigation_kb, card_kb = rendered.keyboards(current_position, total_ads, cursor, search)
     
     # Если у объявления нет фотографий
-    if not photos:
+    if not rendered.photo_ids:
         await message.answer(
-            f"⚠️ Ошибка: у объявления нет фотографий!\n\n{format_ad_description(ad)}",
-            reply_markup=user_kb.get_navigation_kb(current_position, total_ads, ad.id)
+            f"⚠️ Ошибка: у объявления нет фотографий!\n\n{rendered.caption}",
+            reply_markup=navigation_kb
         )
         return
-    
-    # Формируем клавиатуру навигации с использованием реального ad.id
-    navigation_kb = user_kb.get_navigation_kb(current_position, total_ads, ad.id, ad.is_promotional)
+
+    if edit and CAROUSEL_EDIT_IN_PLACE:
+        api_calls = await render_card_in_place(message, rendered, card_kb, keep_message)
+        if api_calls:
+            render_stats.record(api_calls)
+            return
+    if keep_message and not message.photo:
+        edit = False
+
+    # Старый способ: удаляем сообщение и отправляем фото и кнопки заново
+    if edit:
+        render_stats.record(3, fallback=CAROUSEL_EDIT_IN_PLACE)
 
     # Если фото только одно
-    if len(photos) == 1:
-        # Если фото только одно
-        if len(photos) == 1:
-            if edit:
-                await message.delete()
-                await message.bot.send_photo(
-                    chat_id=message.chat.id,
-                    photo=photos[0].photo_file_id,
-                    caption=format_ad_description(ad),
-                    parse_mode='Markdown'
-                )
-
-                await message.bot.send_message(
-                    chat_id=message.chat.id,
-                    text="Используйте кнопки ниже для навигации:",
-                    reply_markup=navigation_kb
-                )
-            else:
-                await message.answer_photo(
-                    photo=photos[0].photo_file_id,
-                    caption=format_ad_description(ad)
-                )
-                await message.answer(
-                    "Используйте кнопки ниже для навигации:",
-                    reply_markup=navigation_kb
-                )
-    else:
-        # Если фото несколько
-        media_group = [
-            InputMediaPhoto(media=photo.photo_file_id)
-            for photo in photos
-        ]
-        # Добавляем описание к последнему фото
-        media_group[-1] = InputMediaPhoto(
-            media=media_group[-1].media,
-            caption=format_ad_description(ad),
-            parse_mode='Markdown'
-        )
+    if len(rendered.photo_ids) == 1:
+        if edit:
+            await message.delete()
+            await message.bot.send_photo(
+                chat_id=message.chat.id,
+                photo=rendered.photo_ids[0],
+                caption=rendered.caption,
+                parse_mode='Markdown'
+            )
 
+            await message.bot.send_message(
+                chat_id=message.chat.id,
+                text="Используйте кнопки ниже для навигации:",
+                reply_markup=navigation_kb
+            )
+        else:
+            await message.answer_photo(
+                photo=rendered.photo_ids[0],
+                caption=rendered.caption
+            )
+            await message.answer(
+                "Используйте кнопки ниже для навигации:",
+                reply_markup=navigation_kb
+            )
+    else:
+        # Если фото несколько, описание уже добавлено к последнему фото группы
         if edit:
             await message.delete()
             bot = message.bot
-            await bot.send_media_group(chat_id=message.chat.id, media=media_group)
+            await bot.send_media_group(chat_id=message.chat.id, media=rendered.media_group)
             await bot.send_message(
                 chat_id=message.chat.id,
                 text="Используйте кнопки ниже для навигации:",
@@ -178,7 +223,7 @@ async def show_advertisement(message, ad, session, current_position, total_ads,
                 parse_mode='Markdown'
             )
         else:
-            await message.answer_media_group(media_group)
+            await message.answer_media_group(rendered.media_group)
             await message.answer(
                 "Используйте кнопки ниже для навигации:",
                 reply_markup=navigation_kb,
@@ -186,141 +231,392 @@ async def show_advertisement(message, ad, session, current_position, total_ads,
             )
 
 
-def format_ad_description(ad: Advertisement) -> str:
+async def render_card_in_place(message, rendered, card_kb, keep_message=False) -> int:
     """
-    Форматирует описание объявления с учётом типа (обычное/рекламное)
+    Показывает объявление одной карточкой: фото с подписью и кнопками.
+    Если текущее сообщение уже карточка, меняет её через editMessageMedia,
+    иначе отправляет новую карточку, а старое сообщение удаляет (кроме keep_message).
+    Возвращает число вызовов Bot API или 0, если нужен старый способ отрисовки.
     """
-    if ad.is_promotional:
-        return f"📢 РЕКЛАМА\n\n{ad.description}"
-    else:
-        return (
-            f"📝 Описание:\n{ad.description}\n\n"
-            f"💰 Цена: {ad.price}\n"
-        )
+    if message.photo:
+        try:
+            await message.edit_media(media=rendered.card_media, reply_markup=card_kb)
+            return 1
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                return 1
+            logging.warning(f"Failed to edit carousel card in place: {e}")
+            return 0
+
+    # Сообщение без фото (текст с кнопками) в фото не превратить:
+    # удаляем его и отправляем карточку, дальше она будет редактироваться
+    if not keep_message:
+        await message.delete()
+    await message.bot.send_photo(
+        chat_id=message.chat.id,
+        photo=rendered.photo_ids[0],
+        caption=rendered.caption,
+        parse_mode='Markdown',
+        reply_markup=card_kb
+    )
+    return 1 if keep_message else 2
+
 
 @router.callback_query(F.data.startswith(("next_", "prev_")))
-async def navigate_ads(callback: CallbackQuery, session: Session, state: FSMContext):
+async def navigate_ads(callback: CallbackQuery, session: AsyncSession, state: FSMContext):
     """
     Обработчик навигации по объявлениям
-    Показывает следующее/предыдущее объявление с шансом показа рекламы
+    Показывает следующее/предыдущее объявление с шансом показа рекламы.
+    Соседнее объявление ищется по keyset-курсору из callback_data.
+    Быстрые повторные нажатия склеиваются: показывается только итоговое объявление
     """
-    action, ad_id_str = callback.data.split("_")
-    ad_id = int(ad_id_str)
-
-    data = await state.get_data()
-    current_index = data.get("current_index", 0)
-    total_ads = data.get("total_ads", 0)
-
-    # Получаем все обычные объявления
-    regular_ads = session.scalars(
-        select(Advertisement)
-        .where(Advertisement.is_promotional == False)
-        .order_by(Advertisement.created_at.desc())
-    ).all()
-
-    # Получаем все рекламные объявления
-    promo_ads = session.scalars(
-        select(Advertisement)
-        .where(Advertisement.is_promotional == True)
-        .order_by(Advertisement.created_at.desc())
-    ).all()
-
-    # Находим текущее объявление по индексу
-    # Если число объявлений изменилось, проверим актуальность current_index
-    if current_index >= len(regular_ads):
-        # Если текущий индекс вне диапазона (например, объявления удалили),
-        # сбрасываем позицию на 0
-        current_index = 0
+    action, raw_cursor = callback.data.split("_", 1)
+    source = (callback.message.message_id, raw_cursor)
+
+    async with navigation_coalescer.navigate(callback.message.chat.id, source, 1 if action == "next" else -1) as ticket:
+        if ticket.superseded:
+            # Пользователь уже нажал ещё раз, итог покажет последнее нажатие
+            await callback.answer()
+            return
+        await show_neighbour(callback, session, raw_cursor, ticket)
+
+
+async def show_neighbour(callback: CallbackQuery, session: AsyncSession, raw_cursor: str, ticket):
+    """Показывает объявление, отстоящее от курсора на ticket.steps шагов"""
+    steps = ticket.steps
+    if not steps:
+        # Нажали вперёд и назад — остаёмся на текущем объявлении
+        await callback.answer()
+        return
+    action = "next" if steps > 0 else "prev"
+
+    # Общее количество объявлений берём из кэша каталога
+    ads_catalog = await catalog.load(session)
 
     # Если нет обычных объявлений
-    if not regular_ads:
+    if not ads_catalog.regular_ids:
         await callback.answer("Объявлений нет! 🤷‍♂️")
         return
 
-    # Двигаем индекс в зависимости от действия
-    if action == "next":
-        # Проверяем, не достигли ли конца
-        if current_index < len(regular_ads) - 1:
-            current_index += 1
-        else:
+    cursor = decode_cursor(raw_cursor)
+    if cursor is None:
+        # Кнопки старого формата содержат только ID объявления
+        cursor = await legacy_cursor(session, ads_catalog, raw_cursor)
+
+    # Ищем объявления на пути к нужному одним запросом;
+    # у края карусели останавливаемся на последнем доступном.
+    # Вперёд берём на одно больше: его карточку прогреем без отдельного запроса
+    count = abs(steps)
+    neighbours = await fetch_neighbours(session, cursor, action, count + 1 if action == "next" else count)
+    upcoming = neighbours.pop() if len(neighbours) > count else None
+    if not neighbours:
+        if action == "next":
             await callback.answer("Это последнее объявление! 🤷‍♂️")
-            return
-    else:  # prev
-        if current_index > 0:
-            current_index -= 1
         else:
             await callback.answer("Это первое объявление! 🤷‍♂️")
-            return
+        return
+    neighbour = neighbours[-1]
+    shift = 1 if action == "next" else -1
 
-    # С вероятностью 20% показываем рекламное объявление при переходе вперед,
-    # но только если действие "next"
-    show_promo = (action == "next") and (random.random() < 0.2) and promo_ads
+    def position_of(ad, offset):
+        index = ads_catalog.index_of(ad.id)
+        # Объявление могло появиться после загрузки кэша
+        return index + 1 if index is not None else cursor.position + offset * shift
 
-    if show_promo:
-        # Показываем случайное рекламное объявление
-        ad_to_show = random.choice(promo_ads)
-        # Откатываем индекс назад, т.к. после рекламы должно показаться следующее обычное объявление
-        if action == "next":
-            current_index -= 1  # Компенсируем increment, который был сделан ранее
+    # Рекламу вставляем только при переходе вперёд; какую и когда — решает расписание
+    schedule = await promo_scheduler.load(session) if action == "next" else None
+
+    # Пока искали объявление, могло прийти новое нажатие — тогда рисует оно.
+    # Проверяем до выбора рекламы: выбранная реклама сразу считается показанной
+    if ticket.superseded:
+        await callback.answer()
+        return
+    promo_id = schedule.pick(callback.from_user.id) if schedule is not None else None
+
+    ad_to_show = None
+    if promo_id is not None:
+        ad_to_show = await Advertisement.get_with_photos(session, promo_id)
+        if ad_to_show is None:
+            # Рекламу удалили в обход бота, кэш устарел
+            catalog.invalidate()
+            promo_scheduler.remove(promo_id)
+
+    if ad_to_show is not None:
+        # Показываем рекламу вместо последнего шага, а курсор ставим перед ним,
+        # чтобы после рекламы показалось нужное обычное объявление
+        if len(neighbours) > 1:
+            previous = neighbours[-2]
+            position = position_of(previous, len(neighbours) - 1)
+            next_cursor = encode_cursor(previous, position)
+        else:
+            position = cursor.position
+            next_cursor = raw_cursor
     else:
-        # Показываем очередное обычное объявление по текущему индексу
-        ad_to_show = regular_ads[current_index]
+        ad_to_show = neighbour
+        next_cursor = None
+        position = position_of(neighbour, len(neighbours))
 
     # Отображаем выбранное объявление
+    position = max(1, min(position, ads_catalog.regular_count))
     await show_advertisement(
         callback.message,
         ad_to_show,
         session,
-        current_position=(current_index + 1),
-        total_ads=len(regular_ads),
-        edit=True
+        current_position=position,
+        total_ads=ads_catalog.regular_count,
+        edit=True,
+        cursor=next_cursor
     )
 
-    # Сохраняем обновленный индекс и общее количество объявлений
-    await state.update_data(current_index=current_index, total_ads=len(regular_ads))
+    # Пока пользователь смотрит карточку, готовим следующую
+    if ad_to_show is neighbour:
+        if upcoming is not None:
+            await render_cache.warm(upcoming, position + 1, ads_catalog.regular_count)
+    else:
+        # После рекламы покажется уже загруженный сосед
+        await render_cache.render(neighbour)
+
+
+async def legacy_cursor(session, ads_catalog, raw_ad_id: str) -> Cursor:
+    """Строит курсор по ID объявления из кнопок, отправленных до перехода на keyset"""
+    ad = await session.get(Advertisement, int(raw_ad_id)) if raw_ad_id.isdigit() else None
+    index = ads_catalog.index_of(ad.id) if ad else None
+    if index is None:
+        # Рекламное или удалённое объявление: начинаем с начала карусели
+        index = 0
+        ad = await session.get(Advertisement, ads_catalog.regular_ids[0])
+    return Cursor(ad.created_at, ad.id, index + 1)
+
+
+@router.callback_query(F.data == "photo_noop")
+async def photo_counter_pressed(callback: CallbackQuery):
+    """Нажатие на счётчик фото ничего не делает"""
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("photo_"))
+async def page_card_photo(callback: CallbackQuery, session: AsyncSession):
+    """
+    Листание фото внутри карточки объявления.
+    Меняет только фото, подпись и кнопки навигации остаются прежними
+    """
+    _, ad_id_str, index_str = callback.data.split("_")
+    ad_id, photo_index = int(ad_id_str), int(index_str)
+
+    photo_ids = (await session.scalars(
+        select(Photo.photo_file_id)
+        .where(Photo.advertisement_id == ad_id)
+        .order_by(Photo.position)
+    )).all()
+    if not photo_ids:
+        await callback.answer("Это объявление уже удалено! 😢")
+        return
+    photo_index %= len(photo_ids)
+
+    card_kb = user_kb.get_card_kb(callback.message.reply_markup, ad_id, photo_index, len(photo_ids))
+    try:
+        await callback.message.edit_media(
+            media=InputMediaPhoto(
+                media=photo_ids[photo_index],
+                caption=callback.message.caption,
+                caption_entities=callback.message.caption_entities
+            ),
+            reply_markup=card_kb
+        )
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            logging.warning(f"Failed to page card photo: {e}")
+    await callback.answer()
 
 
 @router.callback_query(F.data.startswith("rent_"))
-async def rent_ad(callback: CallbackQuery, session: Session):
+async def rent_ad(callback: CallbackQuery, session: AsyncSession):
     """
     Обработчик кнопки "Арендовать"
     Показывает контакт менеджера
     """
     ad_id = int(callback.data.split("_")[1])
-    ad = session.get(Advertisement, ad_id)
+    ad = await session.get(Advertisement, ad_id)
     
     if not ad:
         await callback.answer("Это объявление уже удалено! 😢")
         return
+
+    event_log.add(ad.id, callback.from_user.id, EVENT_RENT, ad.is_promotional)
         
     await callback.message.answer(
         f"👤 Для аренды свяжитесь с менеджером:\n{ad.manager_link}"
     )
 
 @router.message(Command("notifications"))
-async def toggle_notifications(message: Message, session: Session):
+async def toggle_notifications(message: Message, session: AsyncSession):
     """Включение/выключение уведомлений"""
-    user = session.query(User).filter(User.telegram_id == message.from_user.id).first()
+    user = await session.scalar(select(User).where(User.telegram_id == message.from_user.id))
     if not user:
         return
         
     user.notifications_enabled = not user.notifications_enabled
-    session.commit()
+    await session.commit()
     
     status = "включены ✅" if user.notifications_enabled else "выключены ❌"
     await message.answer(f"Уведомления о новых объявлениях {status}")
 
+@router.message(Command("subscribe"))
+async def cmd_subscribe(message: Message, session: AsyncSession):
+    """Сохраняет поиск: /subscribe 30000-50000 студия метро"""
+    query = (message.text or "").partition(" ")[2]
+    try:
+        params = parse_search_query(query)
+    except ValueError:
+        await message.answer(messages.SUBSCRIBE_HELP)
+        return
+
+    searches_count = await session.scalar(
+        select(func.count(SavedSearch.id)).where(SavedSearch.telegram_id == message.from_user.id)
+    )
+    if searches_count >= MAX_SAVED_SEARCHES:
+        await message.answer(f"Можно сохранить не больше {MAX_SAVED_SEARCHES} поисков. Удалите лишние: /searches")
+        return
+
+    search = SavedSearch(telegram_id=message.from_user.id, **params)
+    session.add(search)
+    await session.commit()
+    subscription_index.add(search)
+
+    await message.answer(
+        f"✅ Поиск сохранён: {describe_search(search)}\n"
+        f"Теперь уведомления будут приходить только о подходящих объявлениях."
+    )
+
+@router.message(Command("searches"))
+async def cmd_searches(message: Message, session: AsyncSession):
+    """Список сохранённых поисков с кнопками удаления"""
+    await show_searches(message, session, message.from_user.id)
+
+async def show_searches(message: Message, session: AsyncSession, telegram_id: int, edit: bool = False):
+    """Показывает сохранённые поиски пользователя, при edit=True — в том же сообщении"""
+    searches = (await session.scalars(
+        select(SavedSearch)
+        .where(SavedSearch.telegram_id == telegram_id)
+        .order_by(SavedSearch.id)
+    )).all()
+    if searches:
+        lines = [f"{idx}. {describe_search(search)}" for idx, search in enumerate(searches, 1)]
+        text = "🔔 Ваши сохранённые поиски:\n\n" + "\n".join(lines)
+        keyboard = user_kb.get_searches_kb(searches)
+    else:
+        text, keyboard = messages.NO_SEARCHES_MESSAGE, None
+
+    if edit:
+        await message.edit_text(text, reply_markup=keyboard)
+    else:
+        await message.answer(text, reply_markup=keyboard)
+
+@router.callback_query(F.data.startswith("unsub_"))
+async def delete_search(callback: CallbackQuery, session: AsyncSession):
+    """Удаление сохранённого поиска"""
+    search_id = int(callback.data.split("_")[1])
+    search = await session.get(SavedSearch, search_id)
+    if not search or search.telegram_id != callback.from_user.id:
+        await callback.answer("Поиск уже удалён")
+        return
+
+    await session.delete(search)
+    await session.commit()
+    subscription_index.remove(search_id)
+
+    await callback.answer("Поиск удалён")
+    await show_searches(callback.message, session, callback.from_user.id, edit=True)
+
+@router.message(Command("search"))
+async def cmd_search(message: Message, session: AsyncSession, state: FSMContext):
+    """Полнотекстовый поиск: /search студия у метро. Результаты листаются каруселью"""
+    query = (message.text or "").partition(" ")[2]
+    if not query.strip():
+        await message.answer(messages.SEARCH_HELP)
+        return
+
+    hits = await search_ads(session, query)
+    if not hits:
+        await message.answer(messages.NO_SEARCH_RESULTS)
+        return
+
+    # Список найденных объявлений храним в состоянии, в кнопках — только позицию в нём
+    await state.set_state(UserStates.viewing_ads)
+    await state.update_data(search_results=hits)
+    ad = await Advertisement.get_with_photos(session, hits[0])
+    await message.answer(f"🔎 Найдено объявлений: {len(hits)}")
+    await show_advertisement(
+        message,
+        ad,
+        session,
+        current_position=1,
+        total_ads=len(hits),
+        cursor="1",
+        search=True
+    )
+
+@router.callback_query(F.data.startswith(("snext_", "sprev_")))
+async def navigate_search(callback: CallbackQuery, session: AsyncSession, state: FSMContext):
+    """Листание результатов /search; быстрые нажатия склеиваются, как в карусели"""
+    action, raw_position = callback.data.split("_", 1)
+    if not raw_position.isdigit():
+        await callback.answer()
+        return
+    source = (callback.message.message_id, raw_position)
+
+    async with navigation_coalescer.navigate(callback.message.chat.id, source, 1 if action == "snext" else -1) as ticket:
+        if ticket.superseded:
+            await callback.answer()
+            return
+        await show_search_result(callback, session, state, int(raw_position), ticket)
+
+async def show_search_result(callback: CallbackQuery, session: AsyncSession, state: FSMContext,
+                             position: int, ticket):
+    """Показывает результат поиска, отстоящий от position на ticket.steps шагов"""
+    hits = (await state.get_data()).get("search_results")
+    if not hits:
+        await callback.answer("Результаты поиска устарели, повторите /search")
+        return
+
+    position += ticket.steps
+    while hits:
+        position = max(1, min(position, len(hits)))
+        ad = await Advertisement.get_with_photos(session, hits[position - 1])
+        if ad is not None:
+            break
+        # Объявление удалили после поиска — убираем его из результатов
+        hits.pop(position - 1)
+        await state.update_data(search_results=hits)
+    else:
+        await callback.answer("Найденные объявления уже удалены 😢")
+        return
+
+    if ticket.superseded:
+        await callback.answer()
+        return
+
+    await show_advertisement(
+        callback.message,
+        ad,
+        session,
+        current_position=position,
+        total_ads=len(hits),
+        edit=True,
+        cursor=str(position),
+        search=True
+    )
+
 @router.message(Command("ads"))
-async def cmd_ads(message: Message, session: Session):
+async def cmd_ads(message: Message, session: AsyncSession, state: FSMContext):
     """
     Обработчик команды /ads
     Показывает доступные объявления
     """
-    # Получаем все объявления, отсортированные по дате создания
-    query = select(Advertisement).order_by(Advertisement.created_at.desc())
-    ads = session.scalars(query).all()
+    # Берём порядок объявлений из кэша каталога
+    ads_catalog, ad = await load_first_ad(session)
     
-    if not ads:
+    if ad is None:
         await message.answer(
             messages.NO_ADS_MESSAGE,
             reply_markup=user_kb.get_start_kb()
@@ -330,43 +626,42 @@ async def cmd_ads(message: Message, session: Session):
     # Показываем первое объявление
     await show_advertisement(
         message,
-        ads[0],
+        ad,
         session,
         current_position=1,
-        total_ads=len(ads)
+        total_ads=ads_catalog.regular_count
     )
 
+    await state.set_state(UserStates.viewing_ads)
+
 @router.callback_query(F.data.startswith("view_ad_"))
-async def view_specific_ad(callback: CallbackQuery, session: Session):
+async def view_specific_ad(callback: CallbackQuery, session: AsyncSession, state: FSMContext):
     """
     Показывает конкретное объявление по ID из уведомления
     """
     ad_id = int(callback.data.split("_")[2])
     
     # Получаем объявление по ID
-    ad = session.get(Advertisement, ad_id)
+    ad = await Advertisement.get_with_photos(session, ad_id)
     if not ad:
-        await callback.answer("Упс! Похоже, это объявление уже удалено 😢")
-        # Показываем первое доступное объявление
-        await show_first_ad(callback, session)
+        # Уведомление не трогаем: в дайджесте на нём кнопки других объявлений
+        await callback.answer("Упс! Похоже, это объявление уже удалено 😢", show_alert=True)
         return
         
-    # Получаем общее количество объявлений для навигации
-    total_ads = session.scalar(select(func.count()).select_from(Advertisement))
-    
-    # Определяем позицию текущего объявления
-    current_position = session.scalar(
-        select(func.count())
-        .select_from(Advertisement)
-        .where(Advertisement.created_at >= ad.created_at)
-    )
+    # Позицию и общее количество берём из кэша каталога
+    ads_catalog = await catalog.load(session)
+    current_index = ads_catalog.index_of(ad.id) or 0
     
-    # Показываем запрошенное объявление
+    # Показываем запрошенное объявление. Уведомление не удаляем:
+    # в дайджесте на нём остаются кнопки других объявлений
     await show_advertisement(
         callback.message,
         ad,
         session,
-        current_position=current_position,
-        total_ads=total_ads,
-        edit=True
-    )
\ No newline at end of file
+        current_position=current_index + 1,
+        total_ads=ads_catalog.regular_count,
+        edit=True,
+        keep_message=True
+    )
+
+    await state.set_state(UserStates.viewing_ads)
\ No newline at end of file
@@ -37,15 +37,21 @@ def get_confirm_kb() -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-def get_edit_ad_kb(ad_id: int) -> InlineKeyboardMarkup:
+def get_edit_ad_kb(ad_id: int, is_promotional: bool = False) -> InlineKeyboardMarkup:
     """Клава для редактирования конкретного объявления"""
     keyboard = [
         [InlineKeyboardButton(text="📸 Изменить фото", callback_data=f"edit_photos_{ad_id}")],
         [InlineKeyboardButton(text="📝 Изменить описание", callback_data=f"edit_desc_{ad_id}")],
         [InlineKeyboardButton(text="💰 Изменить цену", callback_data=f"edit_price_{ad_id}")],
         [InlineKeyboardButton(text="👤 Изменить менеджера", callback_data=f"edit_manager_{ad_id}")],
-        [InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_admin")]
     ]
+    if is_promotional:
+        # Настройки ротации есть только у рекламы
+        keyboard += [
+            [InlineKeyboardButton(text="⚖️ Изменить вес", callback_data=f"edit_weight_{ad_id}")],
+            [InlineKeyboardButton(text="🎯 Изменить лимит показов", callback_data=f"edit_budget_{ad_id}")],
+        ]
+    keyboard.append([InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_admin")])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 def get_ads_list_kb(ads: List[Advertisement]) -> InlineKeyboardMarkup:
@@ -1,14 +1,21 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-def get_navigation_kb(current_position: int, total_ads: int, ad_id: int, is_promo: bool = False) -> InlineKeyboardMarkup:
-    """Клавиатура навигации с учетом типа объявления"""
+def get_navigation_kb(current_position: int, total_ads: int, ad_id: int, is_promo: bool = False,
+                      cursor: str = None, search: bool = False) -> InlineKeyboardMarkup:
+    """
+    Клавиатура навигации с учетом типа объявления.
+    cursor — keyset-курсор текущей позиции карусели, по умолчанию ID объявления.
+    search — листание результатов /search (sprev_/snext_ с позицией в результатах)
+    """
     buttons = []
+    cursor = cursor or str(ad_id)
+    prefix = "s" if search else ""
     
     nav_buttons = []
     if current_position > 1:
-        nav_buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"prev_{ad_id}"))
+        nav_buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"{prefix}prev_{cursor}"))
     if current_position < total_ads:
-        nav_buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"next_{ad_id}"))
+        nav_buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"{prefix}next_{cursor}"))
     buttons.append(nav_buttons)
     
     # Кнопка аренды только для обычных объявлений
@@ -20,4 +27,31 @@ def get_navigation_kb(current_position: int, total_ads: int, ad_id: int, is_prom
 def get_start_kb() -> InlineKeyboardMarkup:
     """Стартовая клавиатура"""
     keyboard = [[InlineKeyboardButton(text="🏠 Смотреть объявления", callback_data="show_ads")]]
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
\ No newline at end of file
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+def get_card_kb(navigation_kb: InlineKeyboardMarkup, ad_id: int, photo_index: int, photos_count: int) -> InlineKeyboardMarkup:
+    """
+    Клавиатура карточки объявления: листание фото внутри карточки
+    (если фото несколько) над кнопками навигации
+    """
+    rows = [
+        row for row in navigation_kb.inline_keyboard
+        if not any(button.callback_data.startswith("photo_") for button in row)
+    ]
+    if photos_count > 1:
+        prev_index = (photo_index - 1) % photos_count
+        next_index = (photo_index + 1) % photos_count
+        rows.insert(0, [
+            InlineKeyboardButton(text="◀️", callback_data=f"photo_{ad_id}_{prev_index}"),
+            InlineKeyboardButton(text=f"📷 {photo_index + 1}/{photos_count}", callback_data="photo_noop"),
+            InlineKeyboardButton(text="▶️", callback_data=f"photo_{ad_id}_{next_index}"),
+        ])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+def get_searches_kb(searches) -> InlineKeyboardMarkup:
+    """Кнопки удаления сохранённых поисков"""
+    keyboard = [
+        [InlineKeyboardButton(text=f"❌ Удалить поиск #{idx}", callback_data=f"unsub_{search.id}")]
+        for idx, search in enumerate(searches, 1)
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -0,0 +1,157 @@
+"""
+Журнал показов и кликов по объявлениям и его дневные свёртки.
+События пишутся в ad_events пачками, а фоновая задача периодически
+сворачивает новые записи журнала в ad_daily_stats и daily_stats.
+Экран статистики читает только свёртки.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List
+
+from sqlalchemy import case, func, insert, select, text
+
+from .batching import PeriodicFlusher
+from ..database.models import AdDailyStats, AdEvent, DailyStats, RollupState
+from ..database.session import get_session
+from ..config import EVENT_FLUSH_INTERVAL, EVENT_FLUSH_MAX_EVENTS, ROLLUP_INTERVAL
+
+EVENT_VIEW = "view"
+EVENT_RENT = "rent"
+
+ROLLUP_NAME = "daily"
+
+_AD_DAILY_ROLLUP = text("""
+    INSERT INTO ad_daily_stats (ad_id, day, is_promotional, views, rent_clicks)
+    SELECT ad_id, date(created_at), MAX(is_promotional),
+           SUM(event_type = 'view'), SUM(event_type = 'rent')
+    FROM ad_events
+    WHERE id > :start AND id <= :end
+    GROUP BY ad_id, date(created_at)
+    ON CONFLICT (ad_id, day) DO UPDATE SET
+        views = views + excluded.views,
+        rent_clicks = rent_clicks + excluded.rent_clicks
+""")
+
+_DAILY_ROLLUP = text("""
+    INSERT INTO daily_stats (day, is_promotional, views, rent_clicks)
+    SELECT date(created_at), is_promotional,
+           SUM(event_type = 'view'), SUM(event_type = 'rent')
+    FROM ad_events
+    WHERE id > :start AND id <= :end
+    GROUP BY date(created_at), is_promotional
+    ON CONFLICT (day, is_promotional) DO UPDATE SET
+        views = views + excluded.views,
+        rent_clicks = rent_clicks + excluded.rent_clicks
+""")
+
+
+class EventLog(PeriodicFlusher):
+    """Буфер событий, который сбрасывается в ad_events одним INSERT на пачку"""
+
+    def __init__(self, flush_interval: float = EVENT_FLUSH_INTERVAL, max_events: int = EVENT_FLUSH_MAX_EVENTS):
+        super().__init__(flush_interval, max_events)
+        self._buffer: List[Dict] = []
+        self._flush_lock = asyncio.Lock()
+
+    def add(self, ad_id: int, telegram_id: int, event_type: str, is_promotional: bool = False):
+        """Добавляет событие в буфер без обращения к БД"""
+        self._buffer.append({
+            "ad_id": ad_id,
+            "telegram_id": telegram_id,
+            "event_type": event_type,
+            "is_promotional": bool(is_promotional),
+            "created_at": datetime.utcnow(),
+        })
+        self._count_event()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            rows, self._buffer = self._buffer, []
+            try:
+                async with get_session() as session:
+                    await session.execute(insert(AdEvent), rows)
+                    await session.commit()
+            except Exception as e:
+                logging.error(f"Failed to flush ad events: {e}")
+                # Возвращаем события в начало буфера, чтобы не потерять их
+                self._buffer = rows + self._buffer
+                return
+            logging.debug(f"Flushed {len(rows)} ad events")
+
+
+class StatsRollup(PeriodicFlusher):
+    """Периодически сворачивает новые события журнала в дневные таблицы"""
+
+    def __init__(self, flush_interval: float = ROLLUP_INTERVAL):
+        super().__init__(flush_interval)
+
+    async def flush(self):
+        try:
+            async with get_session() as session:
+                state = await session.get(RollupState, ROLLUP_NAME)
+                if state is None:
+                    state = RollupState(name=ROLLUP_NAME, last_event_id=0)
+                    session.add(state)
+                start = state.last_event_id or 0
+                end = await session.scalar(select(func.max(AdEvent.id))) or 0
+                if end <= start:
+                    return
+                params = {"start": start, "end": end}
+                await session.execute(_AD_DAILY_ROLLUP, params)
+                await session.execute(_DAILY_ROLLUP, params)
+                # Водяной знак двигается в той же транзакции, что и свёртки
+                state.last_event_id = end
+                await session.commit()
+                logging.debug(f"Rolled up ad events {start + 1}..{end}")
+        except Exception as e:
+            logging.error(f"Failed to roll up ad events: {e}")
+
+
+async def get_period_summaries(session, periods: Iterable[int]) -> Dict[int, Dict[str, int]]:
+    """
+    Итоги за последние N дней (включая сегодня) для каждого N из periods.
+    Все периоды считаются одним запросом по свёртке daily_stats.
+    """
+    periods = list(periods)
+    today = datetime.utcnow().date()
+    is_promo = DailyStats.is_promotional == True  # noqa: E712
+    columns = []
+    for days in periods:
+        in_period = DailyStats.day >= today - timedelta(days=days - 1)
+        columns += [
+            func.sum(case((in_period & ~is_promo, DailyStats.views), else_=0)),
+            func.sum(case((in_period & is_promo, DailyStats.views), else_=0)),
+            func.sum(case((in_period, DailyStats.rent_clicks), else_=0)),
+        ]
+    row = (await session.execute(
+        select(*columns).where(DailyStats.day >= today - timedelta(days=max(periods) - 1))
+    )).one()
+    summaries = {}
+    for idx, days in enumerate(periods):
+        views, promo_views, rent_clicks = row[idx * 3:idx * 3 + 3]
+        summaries[days] = {
+            "views": views or 0,
+            "promo_views": promo_views or 0,
+            "rent_clicks": rent_clicks or 0,
+        }
+    return summaries
+
+
+async def get_top_promo(session, days: int):
+    """Самая показываемая реклама за период: (ad_id, views) или None"""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    return (await session.execute(
+        select(AdDailyStats.ad_id, func.sum(AdDailyStats.views).label("views"))
+        .where(AdDailyStats.is_promotional == True, AdDailyStats.day >= since)  # noqa: E712
+        .group_by(AdDailyStats.ad_id)
+        .order_by(text("views DESC"))
+        .limit(1)
+    )).first()
+
+
+# Общие журнал событий и свёртка на весь процесс
+event_log = EventLog()
+stats_rollup = StatsRollup()
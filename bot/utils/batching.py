@@ -0,0 +1,52 @@
+"""
+Базовый класс для фоновых пакетных записей в БД.
+Наследник реализует flush(), а запуск, периодичность
+и досрочный сброс по числу событий живут здесь.
+"""
+import asyncio
+from typing import Optional
+
+
+class PeriodicFlusher:
+    def __init__(self, flush_interval: float, max_events: int = 0):
+        self.flush_interval = flush_interval
+        self.max_events = max_events
+        self._events = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def _count_event(self):
+        """Учитывает событие и будит фоновую задачу, если буфер заполнен"""
+        self._events += 1
+        if self.max_events and self._events >= self.max_events:
+            self._wakeup.set()
+
+    async def flush(self):
+        raise NotImplementedError
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self._events = 0
+            await self.flush()
+
+    def start(self):
+        """Запускает фоновую запись"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновую задачу и сбрасывает остаток буфера в БД"""
+        if self._task is not None:
+            # Не отменяем задачу, чтобы не оборвать запись посередине
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
@@ -0,0 +1,190 @@
+"""
+Параллельная рассылка сообщений с соблюдением лимитов Telegram.
+Общий темп ограничен BROADCAST_RATE сообщений в секунду (лимит Telegram ~30/с),
+одному чату пишем не чаще раза в секунду, RetryAfter приостанавливает
+всю рассылку, а сетевые ошибки и 5xx повторяются с экспоненциальной паузой.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+from aiogram.exceptions import (
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from ..config import (
+    BROADCAST_RATE,
+    BROADCAST_CONCURRENCY,
+    BROADCAST_MAX_RETRIES,
+    BROADCAST_PROGRESS_INTERVAL,
+)
+
+STATUS_SENT = "sent"
+STATUS_BLOCKED = "blocked"
+STATUS_FAILED = "failed"
+
+# Минимальный интервал между сообщениями в один чат, сек
+PER_CHAT_INTERVAL = 1.0
+# Базовая пауза перед повтором после временной ошибки, сек
+RETRY_BACKOFF = 1.0
+
+
+class RateLimiter:
+    """Равномерный общий темп отправки, который можно приостановить по RetryAfter"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+
+    async def acquire(self):
+        now = time.monotonic()
+        slot = max(now, self._next_slot, self._paused_until)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+# Общий лимит на весь процесс, чтобы параллельные рассылки не превышали его вместе
+global_limiter = RateLimiter(BROADCAST_RATE)
+
+
+class BroadcastStats:
+    def __init__(self, total: int, sent: int = 0, blocked: int = 0, failed: int = 0):
+        self.total = total
+        # Ненулевые начальные значения — для рассылки, продолженной после перезапуска
+        self.sent = sent
+        self.blocked = blocked
+        self.failed = failed
+        self.started_at = time.monotonic()
+        self._done_at_start = self.done
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.blocked + self.failed
+
+    @property
+    def rate(self) -> float:
+        """Фактическая скорость, сообщений в секунду"""
+        elapsed = time.monotonic() - self.started_at
+        return (self.done - self._done_at_start) / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Оценка оставшегося времени в секундах"""
+        if not self.rate:
+            return None
+        return (self.total - self.done) / self.rate
+
+    def __str__(self) -> str:
+        eta = f"{self.eta:.0f}s" if self.eta is not None else "?"
+        return (
+            f"{self.done}/{self.total} done (sent {self.sent}, blocked {self.blocked}, "
+            f"failed {self.failed}), {self.rate:.1f} msg/s, ETA {eta}"
+        )
+
+
+class Broadcaster:
+    def __init__(
+        self,
+        limiter: RateLimiter = global_limiter,
+        concurrency: int = BROADCAST_CONCURRENCY,
+        max_retries: int = BROADCAST_MAX_RETRIES,
+        progress_interval: float = BROADCAST_PROGRESS_INTERVAL,
+    ):
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+        self._limiter = limiter
+        self._last_sent: Dict[int, float] = {}
+
+    async def broadcast(
+        self,
+        chat_ids: Iterable[int],
+        send: Callable[[int], Awaitable],
+        on_result: Optional[Callable[[int, str, Optional[str]], None]] = None,
+        on_progress: Optional[Callable[[BroadcastStats], Awaitable]] = None,
+        stats: Optional[BroadcastStats] = None,
+    ) -> BroadcastStats:
+        """
+        Отправляет сообщение каждому чату через send(chat_id).
+        on_result(chat_id, status, error) вызывается после каждого чата,
+        on_progress(stats) — раз в progress_interval секунд и в конце.
+        Общий stats можно передать, если рассылка идёт несколькими пачками
+        """
+        chat_ids = list(chat_ids)
+        if stats is None:
+            stats = BroadcastStats(len(chat_ids))
+        queue = iter(chat_ids)
+
+        async def worker():
+            for chat_id in queue:
+                status, error = await self._deliver(chat_id, send)
+                if status == STATUS_SENT:
+                    stats.sent += 1
+                elif status == STATUS_BLOCKED:
+                    stats.blocked += 1
+                else:
+                    stats.failed += 1
+                if on_result is not None:
+                    on_result(chat_id, status, error)
+
+        async def report_progress():
+            while True:
+                await asyncio.sleep(self.progress_interval)
+                logging.info(f"Broadcast progress: {stats}")
+                if on_progress is not None:
+                    await on_progress(stats)
+
+        reporter = asyncio.create_task(report_progress())
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(chat_ids)) or 1)))
+        finally:
+            reporter.cancel()
+        logging.debug(f"Broadcast finished: {stats}")
+        if on_progress is not None:
+            await on_progress(stats)
+        return stats
+
+    async def _deliver(self, chat_id: int, send: Callable[[int], Awaitable]):
+        """Отправка одному чату с повторами. Возвращает (статус, текст ошибки)"""
+        attempt = 0
+        last_error = None
+        while attempt <= self.max_retries:
+            await self._wait_for_chat(chat_id)
+            await self._limiter.acquire()
+            try:
+                await send(chat_id)
+                self._last_sent[chat_id] = time.monotonic()
+                return STATUS_SENT, None
+            except TelegramRetryAfter as e:
+                # Telegram просит подождать: тормозим всю рассылку, попытка не считается
+                logging.warning(f"Flood control, pausing broadcast for {e.retry_after}s")
+                self._limiter.pause(e.retry_after)
+                last_error = str(e)
+            except TelegramForbiddenError as e:
+                # Пользователь заблокировал бота или удалил аккаунт
+                return STATUS_BLOCKED, str(e)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                last_error = str(e)
+                attempt += 1
+                if attempt <= self.max_retries:
+                    await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            except Exception as e:
+                return STATUS_FAILED, str(e)
+        return STATUS_FAILED, last_error
+
+    async def _wait_for_chat(self, chat_id: int):
+        """Соблюдает лимит Telegram на частоту сообщений в один чат"""
+        last_sent = self._last_sent.get(chat_id)
+        if last_sent is not None:
+            delay = last_sent + PER_CHAT_INTERVAL - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
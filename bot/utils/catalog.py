@@ -0,0 +1,80 @@
+"""
+Кэш каталога объявлений на уровне процесса.
+Хранит упорядоченные ID обычных объявлений и пул рекламных,
+чтобы навигация по карусели не перечитывала всю таблицу на каждый клик.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+
+from .generation import Generation
+from ..database.models import Advertisement
+from ..config import CATALOG_CACHE_TTL
+
+
+class AdCatalog:
+    """
+    Упорядоченный список ID объявлений (новые первыми).
+    Админские изменения сбрасывают кэш через invalidate(),
+    а TTL страхует от изменений, сделанных в обход бота.
+    """
+
+    def __init__(self, ttl: int = CATALOG_CACHE_TTL):
+        self.ttl = ttl
+        self.regular_ids: List[int] = []
+        self.promo_ids: List[int] = []
+        self._positions: Dict[int, int] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        # Общий с другими воркерами номер версии каталога
+        self.generation = Generation()
+        self._loaded_generation = 0
+
+    @property
+    def is_valid(self) -> bool:
+        return (
+            self._loaded_at is not None
+            and time.monotonic() - self._loaded_at < self.ttl
+            and self._loaded_generation == self.generation.current
+        )
+
+    @property
+    def regular_count(self) -> int:
+        return len(self.regular_ids)
+
+    async def load(self, session) -> "AdCatalog":
+        """Возвращает актуальный каталог, при необходимости перечитывая его из БД"""
+        if self.is_valid:
+            return self
+        async with self._lock:
+            # Пока ждали блокировку, каталог мог загрузить другой апдейт
+            if self.is_valid:
+                return self
+            generation = self.generation.current
+            rows = (await session.execute(
+                select(Advertisement.id, Advertisement.is_promotional)
+                .order_by(Advertisement.created_at.desc(), Advertisement.id.desc())
+            )).all()
+            self.regular_ids = [ad_id for ad_id, is_promo in rows if not is_promo]
+            self.promo_ids = [ad_id for ad_id, is_promo in rows if is_promo]
+            self._positions = {ad_id: idx for idx, ad_id in enumerate(self.regular_ids)}
+            self._loaded_at = time.monotonic()
+            self._loaded_generation = generation
+            logging.info(f"Ad catalog loaded: {len(self.regular_ids)} regular, {len(self.promo_ids)} promo")
+        return self
+
+    def index_of(self, ad_id: int) -> Optional[int]:
+        """Позиция обычного объявления в карусели (с нуля) или None"""
+        return self._positions.get(ad_id)
+
+    def invalidate(self):
+        """Сбрасывает кэш после изменения объявлений админом (во всех воркерах)"""
+        self._loaded_at = None
+        self.generation.bump()
+
+
+# Общий кэш каталога на весь процесс
+catalog = AdCatalog()
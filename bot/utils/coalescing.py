@@ -0,0 +1,92 @@
+"""
+Склейка частых нажатий ⬅️/➡️ в одном чате.
+Нажатия на одну и ту же карточку суммируются в число шагов, а отрисовывает
+карточку только последнее из них: более ранние, не успевшие начать
+отрисовку, пропускаются. Отрисовки в одном чате идут по очереди, поэтому
+уже начатая не прерывается на полпути, а следующая показывает итоговое
+объявление. Одиночное нажатие рисуется сразу, ждут только нажатия,
+пришедшие, пока в чате уже ждёт или рисуется другое.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Hashable, Optional
+
+from ..config import CAROUSEL_COALESCE_DELAY
+
+# Кнопки листания, нажатия которых склеиваются. Воркеры не выстраивают их
+# в общую очередь пользователя, иначе нажатия никогда не пересекутся
+NAVIGATION_PREFIXES = ("next_", "prev_", "snext_", "sprev_")
+
+
+class _ChatNavigation:
+    __slots__ = ("source", "steps", "version", "active", "lock")
+
+    def __init__(self):
+        # Карточка, с которой пришли нажатия (сообщение и курсор в его кнопках)
+        self.source: Optional[Hashable] = None
+        self.steps = 0
+        self.version = 0
+        # Обработчики, которые ждут или рисуют в этом чате
+        self.active = 0
+        self.lock = asyncio.Lock()
+
+
+class NavigationTicket:
+    """Нажатие, ожидающее отрисовки"""
+
+    __slots__ = ("_chat", "_version")
+
+    def __init__(self, chat: _ChatNavigation):
+        self._chat = chat
+        self._version = chat.version
+
+    @property
+    def superseded(self) -> bool:
+        """Пришло более новое нажатие, рисовать будет оно"""
+        return self._chat.version != self._version
+
+    @property
+    def steps(self) -> int:
+        """Суммарное смещение от исходной карточки: + вперёд, - назад"""
+        return self._chat.steps
+
+
+class NavigationCoalescer:
+    def __init__(self, delay: float = CAROUSEL_COALESCE_DELAY):
+        self.delay = delay
+        self._chats: Dict[int, _ChatNavigation] = {}
+
+    @asynccontextmanager
+    async def navigate(self, chat_id: int, source: Hashable, step: int):
+        """
+        Регистрирует нажатие и ждёт своей очереди на отрисовку.
+        Внутри блока нужно проверять ticket.superseded: если оно истинно,
+        рисовать не нужно, итог покажет более новое нажатие
+        """
+        chat = self._chats.setdefault(chat_id, _ChatNavigation())
+        # Нажатие в чате, где ничего не ждёт и не рисуется, не с чем склеивать
+        overlaps = chat.active > 0
+        if chat.source != source:
+            chat.source = source
+            chat.steps = 0
+        chat.steps += step
+        chat.version += 1
+        chat.active += 1
+        ticket = NavigationTicket(chat)
+        try:
+            if self.delay and overlaps:
+                # Даём пользователю нажать ещё раз, прежде чем рисовать
+                await asyncio.sleep(self.delay)
+            if ticket.superseded:
+                yield ticket
+            else:
+                async with chat.lock:
+                    yield ticket
+        finally:
+            chat.active -= 1
+            if not chat.active:
+                del self._chats[chat_id]
+
+
+# Общий на весь процесс
+navigation_coalescer = NavigationCoalescer()
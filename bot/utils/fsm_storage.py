@@ -0,0 +1,184 @@
+"""
+Хранилище FSM в SQLite вместо MemoryStorage.
+Состояния пользователей и черновики объявлений переживают перезапуск
+и видны всем процессам бота, работающим с одной базой (WAL).
+Изменения копятся в памяти и сбрасываются одним пакетным upsert
+раз в FSM_FLUSH_INTERVAL. Прочитанные и записанные значения процесс
+держит в LRU-кэше, поэтому БД читается только при промахе: апдейты
+одного пользователя всегда обрабатывает один процесс.
+"""
+import asyncio
+import copy
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .batching import PeriodicFlusher
+from ..database.models import FsmRecord
+from ..database.session import get_session
+from ..config import FSM_STORAGE, FSM_REDIS_URL, FSM_FLUSH_INTERVAL, FSM_FLUSH_MAX_EVENTS, FSM_CACHE_SIZE
+
+_table = FsmRecord.__table__
+
+_EMPTY_DATA = "{}"
+
+
+def _upsert(*columns: str):
+    """INSERT ... ON CONFLICT, обновляющий только переданные колонки"""
+    statement = sqlite_insert(_table)
+    return statement.on_conflict_do_update(
+        index_elements=["key"],
+        set_={column: statement.excluded[column] for column in (*columns, "updated_at")},
+    )
+
+
+_UPSERT_BOTH = _upsert("state", "data")
+_UPSERT_STATE = _upsert("state")
+_UPSERT_DATA = _upsert("data")
+
+
+class SQLiteStorage(PeriodicFlusher, BaseStorage):
+    def __init__(self, flush_interval: float = FSM_FLUSH_INTERVAL, max_events: int = FSM_FLUSH_MAX_EVENTS,
+                 key_builder: Optional[KeyBuilder] = None, cache_size: int = FSM_CACHE_SIZE):
+        super().__init__(flush_interval, max_events)
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self.cache_size = cache_size
+        # Известные значения: ключ -> {"state": ..., "data": ...} (только известные поля)
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Незаписанные изменения: ключ -> {"state": ..., "data": ...} (только изменённые поля)
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        # Изменения, которые пишутся прямо сейчас
+        self._flushing: Dict[str, Dict[str, Any]] = {}
+        self._flush_lock = asyncio.Lock()
+
+    def _cached(self, key: str) -> Dict[str, Any]:
+        """Запись кэша для ключа; самые давние записи вытесняются"""
+        entry = self._cache.get(key)
+        if entry is None:
+            entry = self._cache[key] = {}
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        return entry
+
+    def _buffer(self, key: StorageKey, field: str, value: Any):
+        storage_key = self.key_builder.build(key)
+        self._pending.setdefault(storage_key, {})[field] = value
+        self._cached(storage_key)[field] = value
+        self._count_event()
+
+    def _buffered(self, key: str, field: str):
+        """Значение из ещё не записанных изменений: (найдено, значение)"""
+        for changes in (self._pending, self._flushing):
+            if field in changes.get(key, ()):
+                return True, changes[key][field]
+        return False, None
+
+    async def _get(self, key: str, field: str) -> Any:
+        """Значение поля из кэша, буфера или, при промахе, из БД"""
+        entry = self._cached(key)
+        if field in entry:
+            return entry[field]
+        # Запись могла выпасть из кэша, пока её изменения ещё не записаны
+        found, value = self._buffered(key, field)
+        if found:
+            entry[field] = value
+            return value
+        async with get_session() as session:
+            row = (await session.execute(
+                select(_table.c.state, _table.c.data).where(_table.c.key == key)
+            )).first()
+        # Пока ждали БД, поля могли измениться: свежие значения важнее прочитанных
+        entry = self._cached(key)
+        entry.setdefault("state", row.state if row else None)
+        entry.setdefault("data", json.loads(row.data) if row else {})
+        return entry[field]
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self._buffer(key, "state", state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._get(self.key_builder.build(key), "state")
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        self._buffer(key, "data", copy.deepcopy(dict(data)))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return copy.deepcopy(await self._get(self.key_builder.build(key), "data"))
+
+    async def flush(self):
+        """Записывает накопленные изменения пакетными upsert"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            self._flushing, self._pending = self._pending, {}
+            now = datetime.utcnow()
+            both, state_only, data_only = [], [], []
+            for key, changes in self._flushing.items():
+                row = {
+                    "key": key,
+                    "state": changes.get("state"),
+                    "data": json.dumps(changes["data"], ensure_ascii=False) if "data" in changes else _EMPTY_DATA,
+                    "updated_at": now,
+                }
+                if "state" in changes and "data" in changes:
+                    both.append(row)
+                elif "state" in changes:
+                    state_only.append(row)
+                else:
+                    data_only.append(row)
+            try:
+                async with get_session() as session:
+                    for statement, rows in ((_UPSERT_BOTH, both), (_UPSERT_STATE, state_only), (_UPSERT_DATA, data_only)):
+                        if rows:
+                            await session.execute(statement, rows)
+                    # Пустые записи (после state.clear()) не храним
+                    await session.execute(
+                        delete(_table).where(
+                            _table.c.key.in_(list(self._flushing)),
+                            _table.c.state.is_(None),
+                            _table.c.data == _EMPTY_DATA,
+                        )
+                    )
+                    await session.commit()
+            except Exception as e:
+                logging.error(f"Failed to flush FSM storage: {e}")
+                # Возвращаем изменения в буфер; более новые изменения тех же ключей важнее
+                for key, changes in self._flushing.items():
+                    self._pending[key] = {**changes, **self._pending.get(key, {})}
+                return
+            finally:
+                self._flushing = {}
+            logging.debug(f"Flushed FSM storage: {len(both) + len(state_only) + len(data_only)} keys")
+
+    async def close(self) -> None:
+        """Вызывается диспетчером при остановке: дописываем буфер в БД"""
+        await self.stop()
+
+
+def create_fsm_storage() -> BaseStorage:
+    """
+    Хранилище FSM по настройке FSM_STORAGE: sqlite (по умолчанию), redis или memory.
+    Для redis нужен пакет redis; подойдёт любой сервер с протоколом Redis
+    """
+    if FSM_STORAGE == "redis":
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError as e:
+            raise RuntimeError("FSM_STORAGE=redis требует пакет redis: pip install redis") from e
+        logging.info(f"Using Redis FSM storage at {FSM_REDIS_URL}")
+        return RedisStorage.from_url(FSM_REDIS_URL)
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+    storage = SQLiteStorage()
+    storage.start()
+    return storage
@@ -0,0 +1,29 @@
+"""
+Номер поколения кэша, общий для процессов-воркеров.
+Изменение данных в одном процессе увеличивает номер, а кэши остальных
+процессов сравнивают его со своим и перечитывают данные из БД.
+В обычном однопроцессном режиме номер хранится локально.
+"""
+
+
+class Generation:
+    def __init__(self):
+        self._local = 0
+        self._shared = None
+
+    def attach(self, shared_value):
+        """Подключает общий счётчик (multiprocessing.Value) в процессе-воркере"""
+        self._shared = shared_value
+
+    @property
+    def current(self) -> int:
+        return self._shared.value if self._shared is not None else self._local
+
+    def bump(self) -> int:
+        """Помечает кэши всех процессов устаревшими и возвращает новый номер"""
+        if self._shared is not None:
+            with self._shared.get_lock():
+                self._shared.value += 1
+                return self._shared.value
+        self._local += 1
+        return self._local
@@ -0,0 +1,63 @@
+"""
+Очередь фоновых задач (рассылки и прочие долгие операции).
+Обработчик ставит задачу в очередь и сразу отвечает пользователю,
+а выполняют её воркеры, запущенные при старте бота в main.py.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+from ..config import JOB_WORKERS
+
+
+class JobQueue:
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def enqueue(self, name: str, func: Callable[..., Awaitable], *args, **kwargs) -> int:
+        """Ставит задачу func(*args, **kwargs) в очередь и возвращает число задач перед ней"""
+        if self._queue is None:
+            raise RuntimeError("Job queue is not started. Call job_queue.start() first.")
+        ahead = self._queue.qsize()
+        self._queue.put_nowait((name, func, args, kwargs))
+        logging.info(f"Job '{name}' enqueued, {ahead} jobs ahead")
+        return ahead
+
+    async def _worker(self, number: int):
+        while True:
+            name, func, args, kwargs = await self._queue.get()
+            try:
+                logging.info(f"Worker {number} started job '{name}'")
+                try:
+                    await func(*args, **kwargs)
+                except Exception as e:
+                    logging.exception(f"Job '{name}' failed: {e}")
+                else:
+                    logging.info(f"Worker {number} finished job '{name}'")
+            finally:
+                self._queue.task_done()
+
+    def start(self):
+        """Запускает воркеры"""
+        if not self._tasks:
+            self._queue = asyncio.Queue()
+            self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+
+    async def stop(self):
+        """Останавливает воркеры. Текущие задачи прерываются, ожидающие отбрасываются"""
+        if not self._tasks:
+            return
+        pending = self._queue.qsize()
+        if pending:
+            logging.warning(f"Dropping {pending} pending jobs on shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+
+# Общая очередь задач на весь процесс
+job_queue = JobQueue()
@@ -0,0 +1,69 @@
+"""
+Реестр Telegram file_id для локальных медиафайлов.
+Каждый файл загружается в Telegram один раз, дальше отправляется по file_id.
+Ключ — хэш содержимого, поэтому изменённый файл загрузится заново.
+"""
+import hashlib
+import logging
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from ..database.models import MediaFile
+
+
+class MediaRegistry:
+    def __init__(self):
+        # Путь -> ((mtime, размер), хэш), чтобы не перечитывать файл без изменений
+        self._hashes: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        # Хэш -> file_id
+        self._file_ids: Dict[str, str] = {}
+
+    def content_hash(self, path) -> str:
+        """sha256 содержимого файла, пересчитывается только при изменении файла"""
+        path = str(path)
+        stat = Path(path).stat()
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self._hashes.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+        digest = hashlib.sha256(Path(path).read_bytes()).hexdigest()
+        self._hashes[path] = (signature, digest)
+        return digest
+
+    async def get_file_id(self, session, path) -> Optional[str]:
+        """Возвращает file_id уже загруженного файла или None"""
+        content_hash = self.content_hash(path)
+        file_id = self._file_ids.get(content_hash)
+        if file_id is None:
+            media = await session.get(MediaFile, content_hash)
+            if media is not None:
+                file_id = self._file_ids[content_hash] = media.file_id
+        return file_id
+
+    async def remember(self, session, path, file_id: str):
+        """Сохраняет file_id, полученный после загрузки файла. Коммит делает вызывающий код"""
+        content_hash = self.content_hash(path)
+        self._file_ids[content_hash] = file_id
+        # Upsert, а не merge: после перезапуска файл могут одновременно загрузить
+        # несколько обработчиков, и второй INSERT упал бы на первичном ключе
+        statement = sqlite_insert(MediaFile.__table__).values(
+            content_hash=content_hash, file_id=file_id, created_at=datetime.utcnow()
+        )
+        await session.execute(statement.on_conflict_do_update(
+            index_elements=["content_hash"], set_={"file_id": statement.excluded.file_id}
+        ))
+        logging.info(f"Stored Telegram file_id for {path}")
+
+    async def forget(self, session, path):
+        """Удаляет file_id, который Telegram больше не принимает. Коммит делает вызывающий код"""
+        content_hash = self.content_hash(path)
+        self._file_ids.pop(content_hash, None)
+        await session.execute(delete(MediaFile).where(MediaFile.content_hash == content_hash))
+
+
+# Общий реестр на весь процесс
+media_registry = MediaRegistry()
@@ -6,7 +6,10 @@ WELCOME_MESSAGE = """
 
 📱 Доступные команды:
 /ads - Смотреть объявления
+/search - Поиск по описанию объявлений
 /notifications - Включить/выключить уведомления о новых объявлениях
+/subscribe - Получать уведомления только о подходящих объявлениях
+/searches - Мои сохранённые поиски
 
 Для начала нажмите кнопку "Смотреть объявления" ⬇️
 """
@@ -14,4 +17,33 @@ WELCOME_MESSAGE = """
 NO_ADS_MESSAGE = """
 😔 Пока нет доступных объявлений.
 Загляните позже!
-"""
\ No newline at end of file
+"""
+
+SUBSCRIBE_HELP = """
+🔔 Сохраните поиск, и уведомления будут приходить только о подходящих объявлениях.
+
+Примеры:
+/subscribe 30000-50000 - цена от 30 000 до 50 000
+/subscribe -40000 студия - до 40 000, в описании есть «студия»
+/subscribe метро парковка без_рекламы - оба слова в описании, без рекламы
+
+Все сохранённые поиски: /searches
+"""
+
+SEARCH_HELP = """
+🔎 Напишите, что ищете, после команды — найдутся объявления со всеми словами из запроса.
+
+Например:
+/search студия метро
+/search двушка парковка
+"""
+
+NO_SEARCH_RESULTS = """
+😔 По вашему запросу ничего не нашлось.
+Попробуйте другие слова или посмотрите все объявления: /ads
+"""
+
+NO_SEARCHES_MESSAGE = """
+У вас нет сохранённых поисков, поэтому приходят уведомления обо всех новых объявлениях.
+Добавить поиск: /subscribe
+"""
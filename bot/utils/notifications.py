@@ -1,65 +1,254 @@
 from aiogram import Bot
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from ..database.models import User, Advertisement
+from ..database.models import Advertisement
+import asyncio
+import itertools
 import logging
-from datetime import datetime
-from ..config import ADMIN_IDS
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from ..config import OUTBOX_BATCH_SIZE, BROADCAST_PROGRESS_INTERVAL, NOTIFY_DIGEST_WINDOW
+from ..database.session import get_session
+from .broadcaster import Broadcaster, BroadcastStats, STATUS_SENT, STATUS_BLOCKED, STATUS_FAILED
+from . import outbox
+from .jobs import job_queue
+from .user_activity import user_activity
 
-async def notify_new_ad(bot: Bot, session: Session, ad: Advertisement):
+# Сколько ошибок доставки за рассылку писать в лог поимённо
+ERROR_LOG_SAMPLE = 20
+
+# Очередь разбирает только одна рассылка за раз, иначе две могли бы забрать одни и те же строки
+_drain_lock = asyncio.Lock()
+
+
+def build_notification(ads: List[Advertisement]) -> Tuple[str, InlineKeyboardMarkup]:
     """
-    Отправляет минималистичное уведомление о новом объявлении 
-    с кнопкой для просмотра и ведёт подробный лог отправки
+    Текст и клавиатура уведомления. Несколько новых объявлений
+    собираются в одно сообщение с кнопкой на каждое
     """
-    logging.info(f"Starting notification process for ad ID: {ad.id}")
-    
-    users = session.scalars(
-    select(User).where(
-        (User.notifications_enabled == True) & # noqa: E712
-        (User.telegram_id.notin_(ADMIN_IDS))
-    )
-).all()
-    
-    logging.info(f"Found {len(users)} users with enabled notifications")
-    
+    if len(ads) == 1:
+        keyboard = InlineKeyboardMarkup(
+            inline_keyboard=[[
+                InlineKeyboardButton(text="🏠 Смотреть", callback_data=f"view_ad_{ads[0].id}")
+            ]]
+        )
+        return "Привет! У нас новое объявление! 🏠", keyboard
+
     keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[[
-            InlineKeyboardButton(text="🏠 Смотреть", callback_data=f"view_ad_{ad.id}")
-        ]]
+        inline_keyboard=[
+            [InlineKeyboardButton(text=f"🏠 {ad.price}", callback_data=f"view_ad_{ad.id}")]
+            for ad in ads
+        ]
+    )
+    return f"Привет! У нас новые объявления: {len(ads)} 🏠", keyboard
+
+
+async def send_pending_notifications(bot: Bot, session: AsyncSession, on_progress=None):
+    """
+    Рассылает все ожидающие уведомления из очереди notification_outbox.
+    Получатели забираются пачками, каждый получает одно сообщение
+    обо всех своих новых объявлениях. Строки помечаются отправляемыми
+    окнами по BROADCAST_CONCURRENCY получателей перед их отправкой,
+    а результаты записываются вместе со следующим окном, поэтому после
+    перезапуска рассылка продолжается с того же места.
+    on_progress(stats) получает прогресс и ETA
+    """
+    async with _drain_lock:
+        stats = BroadcastStats(await outbox.count_pending_users(session))
+        logging.info(f"Starting notification broadcast for {stats.total} users")
+
+        # Рассылка идёт пачками, а прогресс показываем не чаще заданного интервала
+        last_report = time.monotonic()
+
+        async def report_progress(stats: BroadcastStats):
+            nonlocal last_report
+            if on_progress is None or time.monotonic() - last_report < BROADCAST_PROGRESS_INTERVAL:
+                return
+            last_report = time.monotonic()
+            await on_progress(stats)
+
+        broadcaster = Broadcaster()
+        logged_errors = 0
+        ads: Dict[int, Optional[Advertisement]] = {}
+        # У большинства пользователей один и тот же набор новых объявлений
+        messages: Dict[Tuple[int, ...], Tuple[str, InlineKeyboardMarkup]] = {}
+        # Сессия одна на все параллельные отправки
+        write_lock = asyncio.Lock()
+
+        while True:
+            batch = await outbox.claim_batch(session, OUTBOX_BATCH_SIZE)
+            if not batch:
+                break
+            # Пока шла рассылка, могли опубликовать ещё объявления
+            stats.total = max(stats.total, stats.done + await outbox.count_pending_users(session))
+
+            missing = {ad_id for rows in batch.values() for _, ad_id in rows} - ads.keys()
+            if missing:
+                found = (await session.scalars(select(Advertisement).where(Advertisement.id.in_(missing)))).all()
+                ads.update({ad_id: None for ad_id in missing})
+                ads.update({ad.id: ad for ad in found})
+
+            results: Dict[int, Tuple[str, Optional[str]]] = {}
+            saved = set()
+            # Получатель -> запись, которая пометила его строки отправляемыми
+            marks: Dict[int, asyncio.Future] = {}
+            user_ads: Dict[int, Tuple[int, ...]] = {}
+            for chat_id, rows in batch.items():
+                ad_ids = tuple(ad_id for _, ad_id in rows if ads[ad_id] is not None)
+                if ad_ids:
+                    user_ads[chat_id] = ad_ids
+                else:
+                    # Объявления удалили до рассылки: сообщать не о чем
+                    results[chat_id] = (STATUS_FAILED, "ad deleted")
+                    stats.failed += 1
+
+            def message_for(chat_id):
+                key = user_ads[chat_id]
+                if key not in messages:
+                    messages[key] = build_notification([ads[ad_id] for ad_id in key])
+                return messages[key]
+
+            async def save(sending=()):
+                async with write_lock:
+                    unsaved = {chat_id: result for chat_id, result in results.items() if chat_id not in saved}
+                    await outbox.save_results(session, batch, unsaved, sending)
+                    saved.update(unsaved)
+
+            # Получатели идут в broadcast в этом же порядке
+            to_mark = iter(user_ads)
+
+            async def send(chat_id):
+                # Одна запись помечает сразу окно следующих получателей;
+                # при повторах после ошибок строки уже помечены
+                if chat_id not in marks:
+                    window = {chat_id, *itertools.islice(to_mark, broadcaster.concurrency)} - marks.keys()
+                    marking = asyncio.ensure_future(save(sending=window))
+                    marks.update(dict.fromkeys(window, marking))
+                # Отправляем только после того, как отметка записана
+                await marks[chat_id]
+                text, keyboard = message_for(chat_id)
+                await bot.send_message(chat_id, text, reply_markup=keyboard)
+
+            def on_result(chat_id, status, error):
+                nonlocal logged_errors
+                results[chat_id] = (status, error)
+                if status == STATUS_SENT:
+                    user_activity.mark_active(chat_id)
+                    return
+                if status == STATUS_BLOCKED:
+                    # Если пользователь заблокировал бота, отключаем уведомления
+                    user_activity.mark_blocked(chat_id)
+                # Подробно пишем только первые ошибки, дальше хватит итоговых счётчиков
+                if logged_errors < ERROR_LOG_SAMPLE:
+                    logged_errors += 1
+                    logging.warning(f"Failed to send notification to user {chat_id} ({status}): {error}")
+                    if logged_errors == ERROR_LOG_SAMPLE:
+                        logging.warning("Further delivery errors are only counted")
+
+            try:
+                await broadcaster.broadcast(
+                    user_ads,
+                    send,
+                    on_result=on_result,
+                    on_progress=report_progress,
+                    stats=stats,
+                )
+            finally:
+                # Записываем оставшиеся результаты даже при остановке бота:
+                # до неотправленных строк рассылка не дошла, они уйдут после перезапуска
+                await save()
+
+        if on_progress is not None:
+            await on_progress(stats)
+
+        logging.info(
+            f"Notification summary: sent {stats.sent}, "
+            f"blocked {stats.blocked}, failed {stats.failed}"
+        )
+        return stats
+
+
+def format_broadcast_status(stats: BroadcastStats) -> str:
+    """Текст статусного сообщения рассылки для админа"""
+    if stats.done >= stats.total:
+        header = "✅ Рассылка завершена"
+    else:
+        eta = f"~{stats.eta:.0f} сек" if stats.eta is not None else "считаем..."
+        header = f"📨 Идёт рассылка, осталось {eta}"
+    return (
+        f"{header}\n\n"
+        f"Обработано: {stats.done}/{stats.total}\n"
+        f"✉️ Доставлено: {stats.sent}\n"
+        f"🚫 Заблокировали бота: {stats.blocked}\n"
+        f"⚠️ Ошибок: {stats.failed}"
     )
-    
-    message_text = "Привет! У нас новое объявление! 🏠"
 
-    successful_sends = 0
-    failed_sends = 0
-    
-    for user in users:
+
+async def broadcast_pending(bot: Bot, status_messages: Iterable[Tuple[int, int]] = ()):
+    """
+    Фоновая задача рассылки уведомлений.
+    Работает в своей сессии и обновляет статусные сообщения админов (chat_id, message_id)
+    """
+    status_messages = list(status_messages)
+
+    async def on_progress(stats: BroadcastStats):
+        text = format_broadcast_status(stats)
+        for chat_id, message_id in status_messages:
+            try:
+                await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id)
+            except Exception as e:
+                # Например, "message is not modified" — на рассылку это не влияет
+                logging.debug(f"Failed to update broadcast status message: {e}")
+
+    async with get_session() as session:
+        await send_pending_notifications(bot, session, on_progress=on_progress)
+
+
+class NotificationDigest:
+    """
+    Окно накопления уведомлений. Объявления, опубликованные в течение
+    window секунд после первого, уходят одной рассылкой и одним сообщением
+    каждому пользователю
+    """
+
+    def __init__(self, window: float = NOTIFY_DIGEST_WINDOW):
+        self.window = window
+        self._scheduled = False
+        self._status_messages: List[Tuple[int, int]] = []
+
+    def schedule(self, bot: Bot, status_chat_id: Optional[int] = None, status_message_id: Optional[int] = None) -> bool:
+        """
+        Планирует рассылку через window секунд. Возвращает False,
+        если объявление присоединилось к уже запланированной рассылке
+        """
+        if status_chat_id is not None and status_message_id is not None:
+            self._status_messages.append((status_chat_id, status_message_id))
+        if self._scheduled:
+            return False
+        self._scheduled = True
+        asyncio.get_running_loop().call_later(self.window, self._enqueue, bot)
+        return True
+
+    def _enqueue(self, bot: Bot):
+        status_messages, self._status_messages = self._status_messages, []
+        self._scheduled = False
         try:
-            await bot.send_message(
-                user.telegram_id,
-                message_text,
-                reply_markup=keyboard
-            )
-            logging.info(f"Successfully sent notification to user {user.telegram_id} "
-                        f"(username: {user.username or 'None'}) "
-                        f"for ad ID: {ad.id}")
-            successful_sends += 1
-            
-            # Обновляем время последней активности пользователя
-            user.last_activity = datetime.utcnow()
-            session.commit()
-            
-        except Exception as e:
-            failed_sends += 1
-            logging.error(f"Failed to send notification to user {user.telegram_id}: {str(e)}")
-            
-            # Если пользователь заблокировал бота, отключаем уведомления
-            if "Forbidden: bot was blocked by the user" in str(e):
-                logging.info(f"User {user.telegram_id} blocked bot, disabling notifications")
-                user.notifications_enabled = False
-                session.commit()
-    
-    logging.info(f"Notification summary for ad ID {ad.id}:")
-    logging.info(f"- Successfully sent: {successful_sends}")
-    logging.info(f"- Failed to send: {failed_sends}")
\ No newline at end of file
+            job_queue.enqueue("notification_broadcast", broadcast_pending, bot, status_messages)
+        except RuntimeError as e:
+            # Бот уже останавливается: строки остались в очереди и уйдут после перезапуска
+            logging.warning(f"Notification broadcast not started: {e}")
+
+
+# Общее окно накопления уведомлений на весь процесс
+notification_digest = NotificationDigest()
+
+
+async def resume_broadcasts(bot: Bot):
+    """Ставит в очередь рассылку, не законченную до перезапуска бота"""
+    async with get_session() as session:
+        await outbox.recover_interrupted(session)
+        pending_users = await outbox.count_pending_users(session)
+    if pending_users:
+        logging.info(f"Resuming notifications for {pending_users} users")
+        job_queue.enqueue("notification_broadcast", broadcast_pending, bot)
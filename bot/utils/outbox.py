@@ -0,0 +1,152 @@
+"""
+Таблица-очередь уведомлений о новых объявлениях (notification_outbox).
+При публикации объявления подходящие получатели записываются в неё
+через INSERT ... SELECT, а рассылка забирает строки пачками по пользователям
+(все новые объявления пользователя уходят одним сообщением) и сохраняет
+результат доставки. Строки помечаются отправляемыми небольшими окнами
+перед их отправкой, поэтому после перезапуска рассылка продолжается с
+оставшихся строк, уже обработанные повторно не отправляются.
+"""
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, func, literal, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from ..database.models import Advertisement, NotificationOutbox, SavedSearch, User
+from ..config import ADMIN_IDS, NOTIFY_WITHOUT_SEARCH
+from .broadcaster import STATUS_FAILED
+from .subscriptions import subscription_index
+
+STATUS_PENDING = "pending"
+# Сообщение отправляется, результат ещё не записан
+STATUS_SENDING = "sending"
+
+_table = NotificationOutbox.__table__
+
+# Сколько telegram_id подставлять в один IN (у SQLite есть лимит на число параметров)
+_IN_CHUNK = 500
+
+_RESULT_STATEMENT = (
+    update(_table)
+    .where(_table.c.id == bindparam("row_id"))
+    .values(
+        status=bindparam("new_status"),
+        attempts=func.coalesce(_table.c.attempts, 0) + 1,
+        last_error=bindparam("error"),
+        updated_at=bindparam("now"),
+    )
+)
+
+
+async def fill_outbox(session, ad: Advertisement) -> int:
+    """
+    Записывает в очередь пользователей с включёнными уведомлениями,
+    которым подходит объявление: тех, чей сохранённый поиск совпал,
+    и (если включено NOTIFY_WITHOUT_SEARCH) всех без сохранённых поисков.
+    Повторный вызов для того же объявления никого не добавляет дважды.
+    Коммит делает вызывающий код
+    """
+    now = datetime.utcnow()
+    enabled = (User.notifications_enabled == True) & (User.telegram_id.notin_(ADMIN_IDS))  # noqa: E712
+    conditions = []
+    if NOTIFY_WITHOUT_SEARCH:
+        conditions.append(~select(SavedSearch.id).where(SavedSearch.telegram_id == User.telegram_id).exists())
+    index = await subscription_index.load(session)
+    matched = sorted(index.match(ad))
+    for start in range(0, len(matched), _IN_CHUNK):
+        conditions.append(User.telegram_id.in_(matched[start:start + _IN_CHUNK]))
+
+    queued = 0
+    for condition in conditions:
+        recipients = select(
+            literal(ad.id), User.telegram_id, literal(STATUS_PENDING), literal(0), literal(now), literal(now)
+        ).where(enabled & condition)
+        result = await session.execute(
+            sqlite_insert(_table)
+            .from_select(["ad_id", "telegram_id", "status", "attempts", "created_at", "updated_at"], recipients)
+            .on_conflict_do_nothing(index_elements=["ad_id", "telegram_id"])
+        )
+        queued += result.rowcount
+    logging.info(f"Queued {queued} notifications for ad ID: {ad.id} ({len(matched)} matched saved searches)")
+    return queued
+
+
+async def claim_batch(session, limit: int) -> Dict[int, List[Tuple[int, int]]]:
+    """
+    Забирает ожидающие строки для следующих limit пользователей.
+    Все объявления одного пользователя попадают в одну пачку,
+    чтобы уйти одним сообщением. Возвращает {telegram_id: [(id строки, ad_id)]}.
+    Строки остаются в ожидании, пока save_results не пометит их отправляемыми:
+    очередь разбирает одна рассылка за раз, поэтому повторно их никто не заберёт
+    """
+    users = (await session.scalars(
+        select(_table.c.telegram_id)
+        .where(_table.c.status == STATUS_PENDING)
+        .group_by(_table.c.telegram_id)
+        .order_by(func.min(_table.c.id))
+        .limit(limit)
+    )).all()
+    if not users:
+        return {}
+    rows = (await session.execute(
+        select(_table.c.telegram_id, _table.c.id, _table.c.ad_id)
+        .where(_table.c.status == STATUS_PENDING, _table.c.telegram_id.in_(users))
+        .order_by(_table.c.id)
+    )).all()
+    batch: Dict[int, List[Tuple[int, int]]] = {}
+    for telegram_id, row_id, ad_id in rows:
+        batch.setdefault(telegram_id, []).append((row_id, ad_id))
+    return batch
+
+
+async def save_results(
+    session,
+    batch: Dict[int, List[Tuple[int, int]]],
+    results: Dict[int, Tuple[str, Optional[str]]],
+    sending: Iterable[int] = (),
+):
+    """
+    Записывает результаты доставки (одинаковые для всех строк пользователя)
+    и помечает строки пользователей из sending отправляемыми, одним коммитом.
+    Вызывается перед отправкой каждого окна получателей, поэтому после аварийной
+    остановки неизвестен исход только сообщений из последних окон
+    """
+    now = datetime.utcnow()
+    params = [
+        {"row_id": row_id, "new_status": status, "error": error, "now": now}
+        for chat_id, (status, error) in results.items()
+        for row_id, _ in batch[chat_id]
+    ]
+    if params:
+        await session.execute(_RESULT_STATEMENT, params)
+    claimed = [row_id for chat_id in sending for row_id, _ in batch[chat_id]]
+    if claimed:
+        await session.execute(
+            update(_table).where(_table.c.id.in_(claimed)).values(status=STATUS_SENDING, updated_at=now)
+        )
+    await session.commit()
+
+
+async def count_pending_users(session) -> int:
+    """Сколько пользователей ещё ждут уведомления"""
+    return await session.scalar(
+        select(func.count(func.distinct(_table.c.telegram_id))).where(_table.c.status == STATUS_PENDING)
+    ) or 0
+
+
+async def recover_interrupted(session) -> int:
+    """
+    Строки, которые отправлялись в момент аварийной остановки, помечаются
+    ошибкой: сообщение могло уйти, и повторная отправка дала бы дубль
+    """
+    result = await session.execute(
+        update(_table)
+        .where(_table.c.status == STATUS_SENDING)
+        .values(status=STATUS_FAILED, last_error="interrupted", updated_at=datetime.utcnow())
+    )
+    await session.commit()
+    if result.rowcount:
+        logging.warning(f"Marked {result.rowcount} interrupted notifications as failed")
+    return result.rowcount
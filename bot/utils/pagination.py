@@ -0,0 +1,69 @@
+"""
+Keyset-пагинация карусели объявлений.
+Курсор — это (created_at, id) текущего обычного объявления и его позиция,
+закодированные прямо в callback_data кнопок ⬅️/➡️.
+"""
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import joinedload
+
+from ..database.models import Advertisement
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class Cursor(NamedTuple):
+    created_at: datetime
+    ad_id: int
+    position: int
+
+
+def encode_cursor(ad: Advertisement, position: int) -> str:
+    """Кодирует курсор в компактную строку для callback_data (лимит 64 байта)"""
+    # В SQLite время хранится без часового пояса
+    created_at = ad.created_at.replace(tzinfo=None)
+    micros = (created_at - EPOCH) // timedelta(microseconds=1)
+    return f"{micros}_{ad.id}_{position}"
+
+
+def decode_cursor(raw: str) -> Optional[Cursor]:
+    """Разбирает курсор из callback_data. Возвращает None для старого формата кнопок"""
+    parts = raw.split("_")
+    if len(parts) != 3:
+        return None
+    try:
+        micros, ad_id, position = (int(part) for part in parts)
+    except ValueError:
+        return None
+    return Cursor(EPOCH + timedelta(microseconds=micros), ad_id, position)
+
+
+async def fetch_neighbours(session, cursor: Cursor, direction: str, count: int) -> List[Advertisement]:
+    """
+    Получает до count следующих обычных объявлений одним запросом.
+    Карусель отсортирована от новых к старым, поэтому "next" — более старые.
+    Фото объявлений подгружаются в том же запросе.
+    """
+    key = tuple_(Advertisement.created_at, Advertisement.id)
+    query = (
+        select(Advertisement)
+        .options(joinedload(Advertisement.photos))
+        .where(Advertisement.is_promotional == False)  # noqa: E712
+    )
+    if direction == "next":
+        query = query.where(key < (cursor.created_at, cursor.ad_id)).order_by(
+            Advertisement.created_at.desc(), Advertisement.id.desc()
+        )
+    else:
+        query = query.where(key > (cursor.created_at, cursor.ad_id)).order_by(
+            Advertisement.created_at.asc(), Advertisement.id.asc()
+        )
+    return list((await session.scalars(query.limit(count))).unique().all())
+
+
+async def fetch_neighbour(session, cursor: Cursor, direction: str) -> Optional[Advertisement]:
+    """Получает соседнее обычное объявление одним запросом с LIMIT 1"""
+    neighbours = await fetch_neighbours(session, cursor, direction, 1)
+    return neighbours[0] if neighbours else None
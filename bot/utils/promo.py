@@ -0,0 +1,208 @@
+"""
+Ротация рекламы в карусели.
+Реклама выбирается по весам через таблицу псевдонимов (O(1) на выбор),
+с заданной частотой вставки, ограничением показов одной рекламы
+одному пользователю за окно времени и общим лимитом показов рекламы.
+Таблица строится в памяти и пересобирается при изменениях рекламы
+без перечитывания БД.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Sequence
+
+from sqlalchemy import select
+
+from .generation import Generation
+from ..database.models import Advertisement
+from ..config import CATALOG_CACHE_TTL, PROMO_RATE, PROMO_USER_CAP, PROMO_CAP_WINDOW
+
+# Сколько раз перевыбирать рекламу, упёршуюся в лимит пользователя
+PICK_ATTEMPTS = 5
+
+# Как часто выбрасывать устаревшие показы пользователей, сек
+CLEANUP_INTERVAL = 300
+
+
+class AliasTable:
+    """Выбор индекса с вероятностью, пропорциональной весу (метод Уолкера — Воуза)"""
+
+    def __init__(self, weights: Sequence[float]):
+        count = len(weights)
+        total = sum(weights)
+        self._prob = [1.0] * count
+        self._alias = list(range(count))
+        if not count or total <= 0:
+            return
+        scaled = [weight * count / total for weight in weights]
+        small = [idx for idx, value in enumerate(scaled) if value < 1]
+        large = [idx for idx, value in enumerate(scaled) if value >= 1]
+        while small and large:
+            low, high = small.pop(), large.pop()
+            self._prob[low] = scaled[low]
+            self._alias[low] = high
+            scaled[high] -= 1 - scaled[low]
+            (small if scaled[high] < 1 else large).append(high)
+        # Остатки из-за погрешности вычислений выбираются всегда
+        for idx in small + large:
+            self._prob[idx] = 1.0
+
+    def __len__(self) -> int:
+        return len(self._prob)
+
+    def pick(self) -> int:
+        idx = random.randrange(len(self._prob))
+        return idx if random.random() < self._prob[idx] else self._alias[idx]
+
+
+class _Promo:
+    __slots__ = ("id", "weight", "budget", "shown")
+
+    def __init__(self, ad_id: int, weight: int, budget: Optional[int], shown: int):
+        self.id = ad_id
+        self.weight = weight
+        self.budget = budget
+        self.shown = shown
+
+    @property
+    def active(self) -> bool:
+        return self.weight > 0 and (self.budget is None or self.shown < self.budget)
+
+
+class PromoScheduler:
+    """
+    Расписание показов рекламы на уровне процесса.
+    Загружается из БД один раз и обновляется на месте при изменениях
+    рекламы админом; TTL подтягивает показы, записанные другими воркерами
+    """
+
+    def __init__(self, rate: float = PROMO_RATE, user_cap: int = PROMO_USER_CAP,
+                 cap_window: float = PROMO_CAP_WINDOW, ttl: int = CATALOG_CACHE_TTL):
+        self.rate = rate
+        self.user_cap = user_cap
+        self.cap_window = cap_window
+        self.ttl = ttl
+        self._promos: Dict[int, _Promo] = {}
+        # Индекс в таблице псевдонимов -> ID рекламы
+        self._ids: List[int] = []
+        self._table = AliasTable([])
+        # Время показов: пользователь -> реклама -> моменты показа в окне
+        self._impressions: Dict[int, Dict[int, Deque[float]]] = {}
+        self._last_cleanup = time.monotonic()
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        # Рекламу меняют в ведущем воркере, а показывают во всех
+        self.generation = Generation()
+        self._loaded_generation = 0
+
+    @property
+    def is_valid(self) -> bool:
+        return (
+            self._loaded_at is not None
+            and time.monotonic() - self._loaded_at < self.ttl
+            and self._loaded_generation == self.generation.current
+        )
+
+    async def load(self, session) -> "PromoScheduler":
+        if self.is_valid:
+            return self
+        async with self._lock:
+            if self.is_valid:
+                return self
+            generation = self.generation.current
+            rows = (await session.execute(
+                select(
+                    Advertisement.id,
+                    Advertisement.promo_weight,
+                    Advertisement.promo_budget,
+                    Advertisement.views_count,
+                ).where(Advertisement.is_promotional == True)  # noqa: E712
+            )).all()
+            self._promos = {
+                ad_id: _Promo(ad_id, weight if weight is not None else 1, budget, views or 0)
+                for ad_id, weight, budget, views in rows
+            }
+            self._rebuild()
+            self._loaded_at = time.monotonic()
+            self._loaded_generation = generation
+            logging.info(f"Promo schedule loaded: {len(self._ids)} of {len(self._promos)} promos active")
+        return self
+
+    def _rebuild(self):
+        """Пересобирает таблицу псевдонимов по активной рекламе"""
+        active = [promo for promo in self._promos.values() if promo.active]
+        self._ids = [promo.id for promo in active]
+        self._table = AliasTable([promo.weight for promo in active])
+
+    def update(self, ad: Advertisement):
+        """Добавляет или обновляет рекламу после коммита"""
+        was_valid = self.is_valid
+        if was_valid:
+            weight = ad.promo_weight if ad.promo_weight is not None else 1
+            # Показы из буфера счётчика ещё не записаны в views_count
+            current = self._promos.get(ad.id)
+            shown = max(ad.views_count or 0, current.shown if current else 0)
+            self._promos[ad.id] = _Promo(ad.id, weight, ad.promo_budget, shown)
+            self._rebuild()
+        self._changed(was_valid)
+
+    def remove(self, ad_id: int):
+        """Убирает удалённую рекламу"""
+        was_valid = self.is_valid
+        if was_valid and self._promos.pop(ad_id, None) is not None:
+            self._rebuild()
+        self._changed(was_valid)
+
+    def _changed(self, was_valid: bool):
+        """Сообщает другим воркерам об изменении рекламы"""
+        previous = self._loaded_generation
+        generation = self.generation.bump()
+        # Своё расписание уже обновлено на месте; перечитываем, только если
+        # после загрузки рекламу менял кто-то ещё
+        if was_valid and generation == previous + 1:
+            self._loaded_generation = generation
+
+    def pick(self, user_id: int) -> Optional[int]:
+        """
+        ID рекламы, которую пора показать пользователю, или None.
+        Выбранная реклама сразу считается показанной
+        """
+        if not self._ids or random.random() >= self.rate:
+            return None
+        now = time.monotonic()
+        if now - self._last_cleanup > CLEANUP_INTERVAL:
+            self._cleanup(now)
+        seen = self._impressions.setdefault(user_id, {})
+        for _ in range(PICK_ATTEMPTS):
+            promo_id = self._ids[self._table.pick()]
+            shown = seen.setdefault(promo_id, deque())
+            while shown and now - shown[0] > self.cap_window:
+                shown.popleft()
+            if len(shown) < self.user_cap:
+                shown.append(now)
+                self._count_impression(promo_id)
+                return promo_id
+        return None
+
+    def _count_impression(self, promo_id: int):
+        promo = self._promos[promo_id]
+        promo.shown += 1
+        if not promo.active:
+            logging.info(f"Promo {promo_id} reached its budget of {promo.budget} impressions")
+            self._rebuild()
+
+    def _cleanup(self, now: float):
+        """Удаляет показы, вышедшие из окна, и пользователей без показов"""
+        self._last_cleanup = now
+        for user_id, seen in list(self._impressions.items()):
+            for promo_id, shown in list(seen.items()):
+                if not shown or now - shown[-1] > self.cap_window:
+                    del seen[promo_id]
+            if not seen:
+                del self._impressions[user_id]
+
+
+# Общее расписание рекламы на весь процесс
+promo_scheduler = PromoScheduler()
@@ -0,0 +1,126 @@
+"""
+Кэш готовых к отправке карточек объявлений.
+Подпись, список InputMediaPhoto и варианты клавиатур строятся один раз
+на версию объявления (ad.id, updated_at) и вытесняются по LRU.
+Следующее объявление карусели прогревается заранее, пока пользователь
+смотрит текущее.
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from aiogram.types import InlineKeyboardMarkup, InputMediaPhoto
+
+from .pagination import Cursor, encode_cursor, fetch_neighbour
+from ..database.models import Advertisement
+from ..database.session import get_session
+from ..keyboards import user_kb
+from ..config import RENDER_CACHE_SIZE
+
+
+def format_ad_description(ad: Advertisement) -> str:
+    """
+    Форматирует описание объявления с учётом типа (обычное/рекламное)
+    """
+    if ad.is_promotional:
+        return f"📢 РЕКЛАМА\n\n{ad.description}"
+    else:
+        return (
+            f"📝 Описание:\n{ad.description}\n\n"
+            f"💰 Цена: {ad.price}\n"
+        )
+
+
+class RenderedAd:
+    """Всё, что нужно для отправки карточки объявления, без обращения к БД"""
+
+    __slots__ = ("ad_id", "is_promotional", "caption", "photo_ids", "card_media", "media_group", "_keyboards")
+
+    def __init__(self, ad: Advertisement, photo_ids: List[str]):
+        self.ad_id = ad.id
+        self.is_promotional = ad.is_promotional
+        self.caption = format_ad_description(ad)
+        self.photo_ids = photo_ids
+        self.card_media = None
+        self.media_group = []
+        if photo_ids:
+            # Карточка редактируется первым фото с подписью
+            self.card_media = InputMediaPhoto(media=photo_ids[0], caption=self.caption, parse_mode='Markdown')
+            # Для старого способа отрисовки подпись ставится к последнему фото группы
+            self.media_group = [InputMediaPhoto(media=photo_id) for photo_id in photo_ids[:-1]]
+            self.media_group.append(InputMediaPhoto(media=photo_ids[-1], caption=self.caption, parse_mode='Markdown'))
+        self._keyboards: Dict[Tuple, Tuple[InlineKeyboardMarkup, InlineKeyboardMarkup]] = {}
+
+    def keyboards(self, current_position: int, total_ads: int, cursor: Optional[str], search: bool = False):
+        """
+        Клавиатура навигации и клавиатура карточки (с листанием фото)
+        для конкретной позиции в карусели или в результатах поиска. Варианты кэшируются
+        """
+        key = (current_position, total_ads, cursor, search)
+        keyboards = self._keyboards.get(key)
+        if keyboards is None:
+            navigation_kb = user_kb.get_navigation_kb(
+                current_position, total_ads, self.ad_id, self.is_promotional, cursor, search
+            )
+            card_kb = user_kb.get_card_kb(navigation_kb, self.ad_id, 0, len(self.photo_ids))
+            keyboards = self._keyboards[key] = (navigation_kb, card_kb)
+        return keyboards
+
+
+class RenderCache:
+    def __init__(self, max_size: int = RENDER_CACHE_SIZE):
+        self.max_size = max_size
+        self._items: "OrderedDict[Tuple, RenderedAd]" = OrderedDict()
+        self._warming: Set[asyncio.Task] = set()
+
+    def get(self, ad: Advertisement) -> Optional[RenderedAd]:
+        """Готовая карточка для текущей версии объявления или None"""
+        key = (ad.id, ad.updated_at)
+        rendered = self._items.get(key)
+        if rendered is not None:
+            self._items.move_to_end(key)
+        return rendered
+
+    def build(self, ad: Advertisement, photo_ids: List[str]) -> RenderedAd:
+        """Строит карточку и кладёт её в кэш, вытесняя самую старую"""
+        rendered = RenderedAd(ad, photo_ids)
+        self._items[(ad.id, ad.updated_at)] = rendered
+        self._items.move_to_end((ad.id, ad.updated_at))
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+        return rendered
+
+    async def render(self, ad: Advertisement) -> RenderedAd:
+        """Карточка из кэша, а при промахе — построенная по подгруженным фото"""
+        rendered = self.get(ad)
+        if rendered is None:
+            photos = await ad.awaitable_attrs.photos
+            rendered = self.build(ad, [photo.photo_file_id for photo in photos])
+        return rendered
+
+    async def warm(self, ad: Advertisement, position: int, total_ads: int):
+        """Готовит карточку и клавиатуры объявления, уже загруженного вместе с фото"""
+        rendered = await self.render(ad)
+        rendered.keyboards(position, total_ads, encode_cursor(ad, position))
+
+    def warm_next(self, cursor: Cursor, total_ads: int):
+        """Прогревает в фоне карточку следующего объявления после курсора"""
+        task = asyncio.create_task(self._warm_next(cursor, total_ads))
+        # Держим ссылку на задачу, иначе её может собрать сборщик мусора
+        self._warming.add(task)
+        task.add_done_callback(self._warming.discard)
+
+    async def _warm_next(self, cursor: Cursor, total_ads: int):
+        try:
+            async with get_session() as session:
+                ad = await fetch_neighbour(session, cursor, "next")
+                if ad is None:
+                    return
+                await self.warm(ad, cursor.position + 1, total_ads)
+        except Exception as e:
+            logging.debug(f"Failed to warm next ad card: {e}")
+
+
+# Общий кэш карточек на весь процесс
+render_cache = RenderCache()
@@ -0,0 +1,37 @@
+"""
+Счётчик вызовов Bot API на один переход по карусели.
+Нужен, чтобы видеть, сколько лимитов Telegram съедает навигация
+и как часто приходится откатываться на старый способ отрисовки.
+"""
+import logging
+
+
+class RenderStats:
+    # Как часто писать сводку в лог (в переходах)
+    LOG_EVERY = 100
+
+    def __init__(self):
+        self.navigations = 0
+        self.api_calls = 0
+        self.fallbacks = 0
+
+    def record(self, api_calls: int, fallback: bool = False):
+        """Учитывает один переход и число потраченных на него вызовов API"""
+        self.navigations += 1
+        self.api_calls += api_calls
+        if fallback:
+            self.fallbacks += 1
+        logging.debug(f"Carousel render: {api_calls} API calls{' (fallback)' if fallback else ''}")
+        if self.navigations % self.LOG_EVERY == 0:
+            logging.info(
+                f"Carousel renders: {self.navigations}, "
+                f"avg API calls per navigation: {self.average:.2f}, fallbacks: {self.fallbacks}"
+            )
+
+    @property
+    def average(self) -> float:
+        return self.api_calls / self.navigations if self.navigations else 0.0
+
+
+# Общий счётчик на весь процесс
+render_stats = RenderStats()
@@ -0,0 +1,42 @@
+"""
+Полнотекстовый поиск по описаниям объявлений через SQLite FTS5.
+Индекс advertisements_fts поддерживается триггерами (см. migrations.py),
+результаты ранжируются по bm25, лучшие совпадения идут первыми.
+"""
+from typing import List, Optional
+
+from sqlalchemy import text
+
+from .subscriptions import tokenize
+from ..config import SEARCH_MAX_RESULTS
+
+_SEARCH_SQL = text("""
+    SELECT advertisements.id
+    FROM advertisements_fts
+    JOIN advertisements ON advertisements.id = advertisements_fts.rowid
+    WHERE advertisements_fts MATCH :query
+      AND advertisements.is_promotional IS NOT 1
+    ORDER BY bm25(advertisements_fts)
+    LIMIT :limit
+""")
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """
+    Запрос FTS5 из текста пользователя: все слова обязательны,
+    каждое ищется по префиксу ("квартир" найдёт и «квартира», и «квартиры»).
+    Слова берутся в кавычки, поэтому операторы FTS5 во вводе не работают
+    """
+    words = sorted(tokenize(query))
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+async def search_ads(session, query: str, limit: int = SEARCH_MAX_RESULTS) -> List[int]:
+    """ID обычных объявлений по запросу, от наиболее релевантного"""
+    match_query = build_match_query(query)
+    if match_query is None:
+        return []
+    rows = await session.execute(_SEARCH_SQL, {"query": match_query, "limit": limit})
+    return [ad_id for ad_id, in rows]
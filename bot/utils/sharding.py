@@ -0,0 +1,165 @@
+"""
+Режим нескольких процессов. Супервизор получает апдейты (polling или вебхук)
+и раздаёт их процессам-воркерам по консистентному хэшу пользователя.
+Все апдейты одного пользователя попадают в один воркер и обрабатываются
+там строго по очереди, а апдейты разных пользователей — параллельно.
+Исключение — кнопки листания карусели: их порядок и склейку обеспечивает
+navigation_coalescer, поэтому они не ждут предыдущих апдейтов пользователя.
+Состояние FSM и база общие (SQLite в WAL), кэши процессов сбрасываются
+через общие номера поколений.
+"""
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import multiprocessing
+import queue
+from collections import Counter
+from typing import Callable, Dict, List, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from .coalescing import NAVIGATION_PREFIXES
+from ..config import ADMIN_IDS, WORKER_MAX_CONCURRENCY
+
+# Воркер, который обслуживает админов и выполняет рассылки
+LEADER_WORKER = 0
+
+# Как часто воркер проверяет, жив ли супервизор, пока ждёт апдейты, сек
+PARENT_CHECK_INTERVAL = 1.0
+
+# spawn, а не fork: супервизор к моменту запуска воркеров уже крутит event loop
+mp_context = multiprocessing.get_context("spawn")
+
+
+class HashRing:
+    """Консистентный хэш: при изменении числа воркеров переезжает малая часть пользователей"""
+
+    def __init__(self, nodes: int, replicas: int = 100):
+        self._ring = sorted(
+            (self._hash(f"{node}:{replica}"), node)
+            for node in range(nodes)
+            for replica in range(replicas)
+        )
+        self._points = [point for point, _ in self._ring]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+    def node_for(self, key: int) -> int:
+        idx = bisect.bisect(self._points, self._hash(str(key))) % len(self._points)
+        return self._ring[idx][1]
+
+
+class UpdateRouter:
+    """
+    Outer-middleware диспетчера супервизора: вместо обработки
+    отправляет апдейт в очередь воркера, выбранного по пользователю
+    """
+
+    def __init__(self, queues: List):
+        self.queues = queues
+        self.ring = HashRing(len(queues))
+
+    def worker_for(self, key: int) -> int:
+        # Админов обслуживает ведущий воркер: там очередь рассылок
+        if key in ADMIN_IDS:
+            return LEADER_WORKER
+        return self.ring.node_for(key)
+
+    async def __call__(self, handler, event: Update, data):
+        user = data.get("event_from_user")
+        chat = data.get("event_chat")
+        key = user.id if user else chat.id if chat else event.update_id
+        callback = event.callback_query
+        ordered = callback is None or not (callback.data or "").startswith(NAVIGATION_PREFIXES)
+        self.queues[self.worker_for(key)].put((key, event.model_dump_json(exclude_unset=True), ordered))
+
+
+def start_workers(count: int, target: Callable, *args) -> Tuple[List, List]:
+    """Запускает воркеры target(index, очередь апдейтов, *args)"""
+    queues = [mp_context.Queue() for _ in range(count)]
+    processes = [
+        mp_context.Process(target=target, args=(index, queues[index], *args), name=f"bot-worker-{index}", daemon=True)
+        for index in range(count)
+    ]
+    for process in processes:
+        process.start()
+    logging.info(f"Started {count} worker processes")
+    return processes, queues
+
+
+async def stop_workers(processes: List, queues: List, timeout: float = 30):
+    """Просит воркеры доделать принятые апдейты и завершиться"""
+    for updates in queues:
+        updates.put(None)
+    loop = asyncio.get_running_loop()
+    for process in processes:
+        await loop.run_in_executor(None, process.join, timeout)
+        if process.is_alive():
+            logging.warning(f"Worker {process.name} did not stop in {timeout}s, terminating")
+            process.terminate()
+    logging.info("All worker processes stopped")
+
+
+def _next_update(updates):
+    """Ждёт апдейт из очереди; None — пора завершаться"""
+    while True:
+        try:
+            return updates.get(timeout=PARENT_CHECK_INTERVAL)
+        except queue.Empty:
+            parent = multiprocessing.parent_process()
+            if parent is not None and not parent.is_alive():
+                logging.warning("Supervisor process is gone, stopping worker")
+                return None
+
+
+async def serve_updates(dp: Dispatcher, bot: Bot, updates, max_concurrency: int = WORKER_MAX_CONCURRENCY):
+    """
+    Обрабатывает апдейты из очереди воркера: по одному на пользователя,
+    в порядке поступления, и не больше max_concurrency одновременно.
+    Листание карусели (ordered=False) идёт мимо очереди пользователя
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    locks: Dict[int, asyncio.Lock] = {}
+    waiting: Counter = Counter()
+    tasks = set()
+
+    async def process(key: int, raw: str, ordered: bool = True):
+        if not ordered:
+            try:
+                async with semaphore:
+                    await dp.feed_raw_update(bot, json.loads(raw))
+            except Exception as e:
+                logging.exception(f"Failed to process update for {key}: {e}")
+            return
+
+        # asyncio.Lock пропускает ожидающих по очереди, поэтому порядок апдейтов сохраняется
+        lock = locks.setdefault(key, asyncio.Lock())
+        waiting[key] += 1
+        try:
+            async with lock, semaphore:
+                await dp.feed_raw_update(bot, json.loads(raw))
+        except Exception as e:
+            logging.exception(f"Failed to process update for {key}: {e}")
+        finally:
+            waiting[key] -= 1
+            if not waiting[key]:
+                del waiting[key]
+                locks.pop(key, None)
+
+    while True:
+        item = await loop.run_in_executor(None, _next_update, updates)
+        if item is None:
+            break
+        task = asyncio.create_task(process(*item))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        logging.info(f"Waiting for {len(tasks)} updates to finish")
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -16,6 +16,8 @@ class EditStates(StatesGroup):
     edit_description = State()
     edit_price = State()
     edit_manager = State()
+    edit_weight = State()
+    edit_budget = State()
     confirm_edit = State()
 
 class UserStates(StatesGroup):
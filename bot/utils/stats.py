@@ -0,0 +1,94 @@
+"""
+Снимок админской статистики с коротким TTL.
+Счётчики по объявлениям собираются одним агрегирующим запросом,
+а готовый снимок переиспользуется, пока не истечёт STATS_CACHE_TTL,
+чтобы частые обновления экрана не конкурировали с пользователями за БД.
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import case, func, select, true
+
+from .analytics import get_period_summaries, get_top_promo
+from ..database.models import Advertisement, Photo
+from ..config import STATS_CACHE_TTL
+
+# Периоды (в днях), за которые показываются итоги из свёрток
+STATS_PERIODS = (1, 7)
+
+
+def _build_totals_query():
+    """Один запрос: счётчики, суммы просмотров, самое просматриваемое и последнее показанное"""
+    is_promo = Advertisement.is_promotional == True  # noqa: E712
+    totals = select(
+        func.count(Advertisement.id).label("total_ads"),
+        func.coalesce(func.sum(case((is_promo, 1), else_=0)), 0).label("promo_ads"),
+        func.coalesce(func.sum(Advertisement.views_count), 0).label("total_views"),
+        func.coalesce(func.sum(case((is_promo, Advertisement.views_count), else_=0)), 0).label("promo_views"),
+        select(func.count()).select_from(Photo).scalar_subquery().label("total_photos"),
+    ).subquery()
+    most_viewed = (
+        select(
+            Advertisement.id.label("most_viewed_id"),
+            Advertisement.description.label("most_viewed_description"),
+            Advertisement.views_count.label("most_viewed_views"),
+        )
+        .order_by(Advertisement.views_count.desc())
+        .limit(1)
+        .subquery()
+    )
+    last_viewed = (
+        select(
+            Advertisement.id.label("last_viewed_id"),
+            Advertisement.last_shown.label("last_viewed_at"),
+        )
+        .where(Advertisement.last_shown.isnot(None))
+        .order_by(Advertisement.last_shown.desc())
+        .limit(1)
+        .subquery()
+    )
+    return select(totals, most_viewed, last_viewed).select_from(
+        totals.outerjoin(most_viewed, true()).outerjoin(last_viewed, true())
+    )
+
+
+_TOTALS_QUERY = _build_totals_query()
+
+
+class StatsCache:
+    def __init__(self, ttl: int = STATS_CACHE_TTL):
+        self.ttl = ttl
+        self._snapshot: Optional[Dict] = None
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_valid(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def get(self, session) -> Dict:
+        """Возвращает снимок статистики, пересчитывая его не чаще раза в TTL"""
+        if self.is_valid:
+            return self._snapshot
+        async with self._lock:
+            # Пока ждали блокировку, снимок мог обновить другой админ
+            if self.is_valid:
+                return self._snapshot
+            row = (await session.execute(_TOTALS_QUERY)).one()
+            snapshot = dict(row._mapping)
+            snapshot["periods"] = await get_period_summaries(session, STATS_PERIODS)
+            snapshot["top_promo"] = await get_top_promo(session, max(STATS_PERIODS))
+            snapshot["collected_at"] = datetime.now()
+            self._snapshot = snapshot
+            self._loaded_at = time.monotonic()
+        return self._snapshot
+
+    def invalidate(self):
+        """Сбрасывает снимок после изменения объявлений админом"""
+        self._loaded_at = None
+
+
+# Общий кэш статистики на весь процесс
+stats_cache = StatsCache()
@@ -0,0 +1,228 @@
+"""
+Сохранённые поиски пользователей и обратный индекс по ним.
+Для нового объявления получатели находятся по словам его описания
+(слово -> поиски с этим словом) и по отсортированному списку поисков
+без слов, а не перебором и проверкой каждого пользователя.
+"""
+import asyncio
+import bisect
+import logging
+import re
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from .generation import Generation
+from ..database.models import Advertisement, SavedSearch
+
+_WORD_RE = re.compile(r"\w+")
+_PRICE_RE = re.compile(r"\d[\d\s.,]*")
+_RANGE_RE = re.compile(r"^(\d*)-(\d*)$")
+
+# Слово в запросе /subscribe, отключающее рекламу для этого поиска
+NO_PROMO_FLAG = "без_рекламы"
+
+
+def tokenize(text: str) -> Set[str]:
+    """Слова текста в нижнем регистре, без однобуквенных"""
+    return {word for word in _WORD_RE.findall((text or "").lower()) if len(word) > 1}
+
+
+def parse_price(price: str) -> Optional[int]:
+    """Число из строки цены вида "50.000₽" или "45 000 руб/мес", None если его нет"""
+    match = _PRICE_RE.search(price or "")
+    if not match:
+        return None
+    digits = re.sub(r"\D", "", match.group())
+    return int(digits) if digits else None
+
+
+def parse_search_query(text: str) -> Dict:
+    """
+    Разбирает запрос вида "30000-50000 студия метро без_рекламы".
+    Диапазон цены можно задать с одной стороны ("-50000", "30000-").
+    Бросает ValueError, если условий нет
+    """
+    min_price = max_price = None
+    include_promo = True
+    keywords: Set[str] = set()
+    for part in text.split():
+        part = part.lower()
+        price_range = _RANGE_RE.match(part)
+        if price_range and part != "-":
+            low, high = price_range.groups()
+            min_price = int(low) if low else None
+            max_price = int(high) if high else None
+        elif part == NO_PROMO_FLAG:
+            include_promo = False
+        else:
+            keywords |= tokenize(part)
+    if min_price is not None and max_price is not None and min_price > max_price:
+        min_price, max_price = max_price, min_price
+    if min_price is None and max_price is None and not keywords and include_promo:
+        raise ValueError("empty search")
+    return {
+        "min_price": min_price,
+        "max_price": max_price,
+        "keywords": " ".join(sorted(keywords)) or None,
+        "include_promo": include_promo,
+    }
+
+
+def describe_search(search: SavedSearch) -> str:
+    """Короткое описание поиска для списка /searches"""
+    parts = []
+    if search.min_price is not None and search.max_price is not None:
+        parts.append(f"💰 {search.min_price}–{search.max_price}")
+    elif search.min_price is not None:
+        parts.append(f"💰 от {search.min_price}")
+    elif search.max_price is not None:
+        parts.append(f"💰 до {search.max_price}")
+    if search.keywords:
+        parts.append(f"🔎 {search.keywords}")
+    if search.include_promo is False:
+        parts.append("🚫 без рекламы")
+    return ", ".join(parts)
+
+
+class _Search(NamedTuple):
+    id: int
+    telegram_id: int
+    min_price: Optional[int]
+    max_price: Optional[int]
+    keywords: Tuple[str, ...]
+    include_promo: bool
+
+    def accepts(self, price: Optional[int], is_promotional: bool) -> bool:
+        """Условия поиска, не покрытые индексом по словам"""
+        if is_promotional and not self.include_promo:
+            return False
+        if self.min_price is None and self.max_price is None:
+            return True
+        if price is None:
+            return False
+        if self.min_price is not None and price < self.min_price:
+            return False
+        return self.max_price is None or price <= self.max_price
+
+
+class SubscriptionIndex:
+    """
+    Обратный индекс сохранённых поисков. Загружается из БД один раз,
+    дальше обновляется на месте при сохранении и удалении поисков.
+    Изменения из других воркеров приводят к перечитыванию индекса
+    """
+
+    def __init__(self):
+        self._searches: Dict[int, _Search] = {}
+        self._by_keyword: Dict[str, Set[int]] = {}
+        # Поиски без слов, отсортированные по нижней границе цены
+        self._open: List[Tuple[int, int]] = []
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        # Поиски сохраняются в любом воркере, а рассылку делает один, поэтому
+        # изменения в других процессах заставляют перечитать индекс
+        self.generation = Generation()
+        self._loaded_generation = 0
+
+    @property
+    def is_valid(self) -> bool:
+        return self._loaded and self._loaded_generation == self.generation.current
+
+    async def load(self, session) -> "SubscriptionIndex":
+        if self.is_valid:
+            return self
+        async with self._lock:
+            if self.is_valid:
+                return self
+            generation = self.generation.current
+            self._searches.clear()
+            self._by_keyword.clear()
+            self._open.clear()
+            for search in (await session.scalars(select(SavedSearch))).all():
+                self._add(search)
+            self._loaded = True
+            self._loaded_generation = generation
+            logging.info(f"Subscription index loaded: {len(self._searches)} saved searches")
+        return self
+
+    def _add(self, search: SavedSearch):
+        entry = _Search(
+            search.id,
+            search.telegram_id,
+            search.min_price,
+            search.max_price,
+            tuple((search.keywords or "").split()),
+            search.include_promo is not False,
+        )
+        self._searches[entry.id] = entry
+        if entry.keywords:
+            for keyword in entry.keywords:
+                self._by_keyword.setdefault(keyword, set()).add(entry.id)
+        else:
+            bisect.insort(self._open, (entry.min_price or 0, entry.id))
+
+    def add(self, search: SavedSearch):
+        """Добавляет сохранённый поиск (после коммита)"""
+        was_valid = self.is_valid
+        if was_valid:
+            self._add(search)
+        self._changed(was_valid)
+
+    def remove(self, search_id: int):
+        """Убирает удалённый поиск"""
+        was_valid = self.is_valid
+        entry = self._searches.pop(search_id, None) if was_valid else None
+        if entry is not None:
+            if entry.keywords:
+                for keyword in entry.keywords:
+                    ids = self._by_keyword[keyword]
+                    ids.discard(entry.id)
+                    if not ids:
+                        del self._by_keyword[keyword]
+            else:
+                self._open.remove((entry.min_price or 0, entry.id))
+        self._changed(was_valid)
+
+    def _changed(self, was_valid: bool):
+        """Сообщает другим воркерам об изменении поисков"""
+        previous = self._loaded_generation
+        generation = self.generation.bump()
+        # Свой индекс уже обновлён на месте; если между загрузкой и этим изменением
+        # поиски никто не менял, перечитывать его не нужно
+        if was_valid and generation == previous + 1:
+            self._loaded_generation = generation
+
+    def match(self, ad: Advertisement) -> Set[int]:
+        """telegram_id пользователей, чьи поиски подходят под объявление"""
+        price = parse_price(ad.price)
+        is_promotional = bool(ad.is_promotional)
+
+        # Поиски со словами: подходят те, у которых нашлись все слова
+        hits: Counter = Counter()
+        for word in tokenize(ad.description):
+            for search_id in self._by_keyword.get(word, ()):
+                hits[search_id] += 1
+        candidates = [
+            self._searches[search_id]
+            for search_id, count in hits.items()
+            if count == len(self._searches[search_id].keywords)
+        ]
+
+        # Поиски без слов: при известной цене отсекаем те, чья нижняя граница выше
+        if price is None:
+            open_ids = self._open
+        else:
+            open_ids = self._open[:bisect.bisect_right(self._open, (price, float("inf")))]
+        candidates += [self._searches[search_id] for _, search_id in open_ids]
+
+        return {
+            search.telegram_id
+            for search in candidates
+            if search.accepts(price, is_promotional)
+        }
+
+
+# Общий индекс подписок на весь процесс
+subscription_index = SubscriptionIndex()
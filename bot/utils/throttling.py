@@ -0,0 +1,95 @@
+"""
+Ограничение частоты апдейтов от одного пользователя.
+У каждого пользователя своё ведро токенов на каждую группу обработчиков
+(карусель, админка, команды): апдейт тратит токен, токены восполняются
+с заданной скоростью. Апдейты сверх лимита отбрасываются до открытия
+сессии БД, а нажатия кнопок просто гасятся пустым callback.answer().
+"""
+import logging
+import time
+from typing import Dict, NamedTuple, Tuple
+
+from aiogram.types import Update
+
+from ..config import (
+    ADMIN_IDS,
+    THROTTLE_CAROUSEL_RATE,
+    THROTTLE_CAROUSEL_BURST,
+    THROTTLE_COMMANDS_RATE,
+    THROTTLE_COMMANDS_BURST,
+    THROTTLE_ADMIN_RATE,
+    THROTTLE_ADMIN_BURST,
+)
+
+GROUP_CAROUSEL = "carousel"
+GROUP_ADMIN = "admin"
+GROUP_COMMANDS = "commands"
+
+# Кнопки, которые листают объявления и фото
+CAROUSEL_PREFIXES = ("next_", "prev_", "snext_", "sprev_", "photo_", "show_ads", "view_ad_")
+
+# Как часто выбрасывать вёдра давно неактивных пользователей, сек
+CLEANUP_INTERVAL = 60
+
+
+class Limit(NamedTuple):
+    rate: float
+    burst: int
+
+
+DEFAULT_LIMITS = {
+    GROUP_CAROUSEL: Limit(THROTTLE_CAROUSEL_RATE, THROTTLE_CAROUSEL_BURST),
+    GROUP_COMMANDS: Limit(THROTTLE_COMMANDS_RATE, THROTTLE_COMMANDS_BURST),
+    GROUP_ADMIN: Limit(THROTTLE_ADMIN_RATE, THROTTLE_ADMIN_BURST),
+}
+
+
+def handler_group(update: Update, user_id: int) -> str:
+    """Группа обработчиков, к которой относится апдейт"""
+    if user_id in ADMIN_IDS:
+        return GROUP_ADMIN
+    callback = update.callback_query
+    if callback is not None and (callback.data or "").startswith(CAROUSEL_PREFIXES):
+        return GROUP_CAROUSEL
+    return GROUP_COMMANDS
+
+
+class ThrottlingMiddleware:
+    """Middleware диспетчера: token bucket на пользователя и группу обработчиков"""
+
+    def __init__(self, limits: Dict[str, Limit] = None):
+        self.limits = limits or DEFAULT_LIMITS
+        # (пользователь, группа) -> (токены, время последнего пересчёта)
+        self._buckets: Dict[Tuple[int, str], Tuple[float, float]] = {}
+        self._last_cleanup = time.monotonic()
+
+    def allow(self, user_id: int, group: str) -> bool:
+        """Тратит токен из ведра пользователя, False если ведро пустое"""
+        limit = self.limits[group]
+        now = time.monotonic()
+        tokens, updated = self._buckets.get((user_id, group), (limit.burst, now))
+        tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+        allowed = tokens >= 1
+        self._buckets[(user_id, group)] = (tokens - 1 if allowed else tokens, now)
+        if now - self._last_cleanup > CLEANUP_INTERVAL:
+            self._cleanup(now)
+        return allowed
+
+    def _cleanup(self, now: float):
+        """Удаляет вёдра, которые уже успели наполниться: они равны новым"""
+        self._last_cleanup = now
+        for key, (tokens, updated) in list(self._buckets.items()):
+            limit = self.limits[key[1]]
+            if tokens + (now - updated) * limit.rate >= limit.burst:
+                del self._buckets[key]
+
+    async def __call__(self, handler, event: Update, data):
+        user = data.get("event_from_user")
+        if user is None or (event.callback_query is None and event.message is None):
+            return await handler(event, data)
+        group = handler_group(event, user.id)
+        if self.allow(user.id, group):
+            return await handler(event, data)
+        logging.debug(f"Throttled {group} update from {user.id}")
+        if event.callback_query is not None:
+            await event.callback_query.answer()
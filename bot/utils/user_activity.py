@@ -0,0 +1,64 @@
+"""
+Буферизованные обновления пользователей во время рассылок.
+Время активности доставленным и отключение уведомлений заблокировавшим бота
+копятся в памяти и записываются двумя пакетными UPDATE раз в N секунд,
+а не транзакцией на каждого получателя.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Set
+
+from sqlalchemy import update
+
+from .batching import PeriodicFlusher
+from ..database.models import User
+from ..database.session import get_session
+from ..config import USER_FLUSH_INTERVAL, USER_FLUSH_MAX_EVENTS
+
+
+class UserActivityWriter(PeriodicFlusher):
+    def __init__(self, flush_interval: float = USER_FLUSH_INTERVAL, max_events: int = USER_FLUSH_MAX_EVENTS):
+        super().__init__(flush_interval, max_events)
+        self._active: Set[int] = set()
+        self._blocked: Set[int] = set()
+        self._flush_lock = asyncio.Lock()
+
+    def mark_active(self, telegram_id: int):
+        """Пользователю доставлено сообщение"""
+        self._active.add(telegram_id)
+        self._count_event()
+
+    def mark_blocked(self, telegram_id: int):
+        """Пользователь заблокировал бота: уведомления ему больше не шлём"""
+        self._blocked.add(telegram_id)
+        self._count_event()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._active and not self._blocked:
+                return
+            active, blocked = self._active, self._blocked
+            self._active, self._blocked = set(), set()
+            try:
+                async with get_session() as session:
+                    if active:
+                        await session.execute(
+                            update(User).where(User.telegram_id.in_(active)).values(last_activity=datetime.utcnow())
+                        )
+                    if blocked:
+                        await session.execute(
+                            update(User).where(User.telegram_id.in_(blocked)).values(notifications_enabled=False)
+                        )
+                    await session.commit()
+            except Exception as e:
+                logging.error(f"Failed to flush user updates: {e}")
+                # Возвращаем обновления в буфер, чтобы записать их в следующий раз
+                self._active |= active
+                self._blocked |= blocked
+                return
+            logging.debug(f"Flushed user updates: {len(active)} active, {len(blocked)} blocked")
+
+
+# Общий буфер обновлений пользователей на весь процесс
+user_activity = UserActivityWriter()
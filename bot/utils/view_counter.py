@@ -0,0 +1,75 @@
+"""
+Буферизованный счётчик просмотров объявлений.
+Показы копятся в памяти и записываются в БД одним пакетным UPDATE
+раз в N секунд или после M показов, а не отдельной транзакцией на каждый клик.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict
+
+from sqlalchemy import bindparam, func, update
+
+from .batching import PeriodicFlusher
+from ..database.models import Advertisement
+from ..database.session import get_session
+from ..config import VIEW_FLUSH_INTERVAL, VIEW_FLUSH_MAX_EVENTS
+
+_table = Advertisement.__table__
+
+# Инкремент счётчика и время последнего показа для каждого объявления.
+# updated_at оставляем прежним, иначе сработает onupdate: просмотр — не правка,
+# а кэш карточек привязан к версии (id, updated_at)
+_FLUSH_STATEMENT = (
+    update(_table)
+    .where(_table.c.id == bindparam("ad_id"))
+    .values(
+        views_count=func.coalesce(_table.c.views_count, 0) + bindparam("delta"),
+        last_shown=bindparam("shown"),
+        updated_at=_table.c.updated_at,
+    )
+)
+
+
+class ViewCounter(PeriodicFlusher):
+    def __init__(self, flush_interval: float = VIEW_FLUSH_INTERVAL, max_events: int = VIEW_FLUSH_MAX_EVENTS):
+        super().__init__(flush_interval, max_events)
+        self._pending: Dict[int, int] = defaultdict(int)
+        self._last_shown: Dict[int, datetime] = {}
+        self._flush_lock = asyncio.Lock()
+
+    def add(self, ad_id: int):
+        """Учитывает один показ объявления без обращения к БД"""
+        self._pending[ad_id] += 1
+        self._last_shown[ad_id] = datetime.utcnow()
+        self._count_event()
+
+    async def flush(self):
+        """Записывает накопленные показы одним пакетным UPDATE"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending, last_shown = self._pending, self._last_shown
+            self._pending, self._last_shown = defaultdict(int), {}
+
+            params = [
+                {"ad_id": ad_id, "delta": delta, "shown": last_shown[ad_id]}
+                for ad_id, delta in pending.items()
+            ]
+            try:
+                async with get_session() as session:
+                    await session.execute(_FLUSH_STATEMENT, params)
+                    await session.commit()
+            except Exception as e:
+                logging.error(f"Failed to flush view counters: {e}")
+                # Возвращаем показы в буфер, чтобы записать их в следующий раз
+                for ad_id, delta in pending.items():
+                    self._pending[ad_id] += delta
+                    self._last_shown.setdefault(ad_id, last_shown[ad_id])
+                return
+            logging.debug(f"Flushed views for {len(params)} ads")
+
+
+# Общий счётчик просмотров на весь процесс
+view_counter = ViewCounter()
@@ -0,0 +1,121 @@
+"""
+Режим вебхука: апдейты приходят POST-запросами на встроенный aiohttp-сервер.
+Telegram сразу получает ответ 200, а апдейт обрабатывается в фоне,
+не более WEBHOOK_MAX_CONCURRENCY одновременно. При остановке сервер
+перестаёт принимать запросы и дожидается уже принятых апдейтов.
+"""
+import asyncio
+import logging
+import signal
+from typing import Any, Dict
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from ..config import (
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_URL,
+    WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONCURRENCY,
+    WEBHOOK_DRAIN_TIMEOUT,
+)
+
+
+class LimitedRequestHandler(SimpleRequestHandler):
+    """Обработчик вебхука с ограничением параллельных апдейтов и плавной остановкой"""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_concurrency: int = WEBHOOK_MAX_CONCURRENCY,
+                 drain_timeout: float = WEBHOOK_DRAIN_TIMEOUT, **kwargs):
+        super().__init__(dispatcher, bot, handle_in_background=True, **kwargs)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.drain_timeout = drain_timeout
+        self.draining = False
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        async with self._semaphore:
+            try:
+                await super()._background_feed_update(bot, update)
+            except Exception as e:
+                logging.exception(f"Failed to process webhook update {update.get('update_id')}: {e}")
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.draining:
+            # Telegram повторит доставку, когда бот поднимется снова
+            return web.Response(status=503, text="Shutting down")
+        return await super().handle(request)
+
+    @property
+    def in_flight(self) -> int:
+        """Сколько принятых апдейтов ещё обрабатывается или ждёт очереди"""
+        return len(self._background_feed_update_tasks)
+
+    async def health(self, request: web.Request) -> web.Response:
+        status = 503 if self.draining else 200
+        return web.json_response(
+            {"status": "draining" if self.draining else "ok", "in_flight": self.in_flight},
+            status=status,
+        )
+
+    async def drain(self):
+        """Перестаёт принимать апдейты и ждёт обработки уже принятых"""
+        self.draining = True
+        tasks = set(self._background_feed_update_tasks)
+        if not tasks:
+            return
+        logging.info(f"Waiting for {len(tasks)} webhook updates to finish")
+        done, pending = await asyncio.wait(tasks, timeout=self.drain_timeout)
+        if pending:
+            logging.warning(f"Cancelling {len(pending)} webhook updates after {self.drain_timeout}s drain timeout")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def close(self) -> None:
+        # Сессию бота закрывает main.py после остановки фоновых задач
+        await self.drain()
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """
+    Поднимает aiohttp-сервер с вебхуком и /health и работает до SIGINT/SIGTERM.
+    Если задан WEBHOOK_URL, регистрирует вебхук в Telegram; без него
+    сервер можно проверить локально, отправляя POST с апдейтами на WEBHOOK_PATH
+    """
+    app = web.Application()
+    handler = LimitedRequestHandler(dp, bot, secret_token=WEBHOOK_SECRET or None)
+    handler.register(app, path=WEBHOOK_PATH)
+    app.router.add_get("/health", handler.health)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    logging.info(f"Webhook server listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logging.info(f"Webhook registered at {WEBHOOK_URL}")
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Windows: остаётся остановка по KeyboardInterrupt
+            pass
+
+    try:
+        await stop_event.wait()
+        logging.info("Stopping webhook server")
+    finally:
+        # Закрывает порт, затем on_shutdown дожидается принятых апдейтов
+        await runner.cleanup()
@@ -3,9 +3,10 @@ import random
 import asyncio
 from datetime import datetime, timedelta
 from pathlib import Path
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from bot.database.models import Advertisement, Photo, Base
+from sqlalchemy import delete
+from bot.database.models import Advertisement, Photo
+from bot.database.session import setup_engine, get_session, dispose_engine
+from bot.utils.media_registry import media_registry
 from bot.config import DATABASE_URL, MEDIA_DIR, BOT_TOKEN, ADMIN_IDS
 from aiogram import Bot
 import logging
@@ -58,8 +59,14 @@ def get_random_images(num_images):
     selected_images = random.choices(image_files, k=num_images)
     return [str(img) for img in selected_images]
 
-async def upload_photo_to_telegram(bot: Bot, photo_path: str) -> str:
-    """Загружает фото в Telegram и возвращает file_id"""
+async def upload_photo_to_telegram(bot: Bot, session, photo_path: str) -> str:
+    """
+    Загружает фото в Telegram и возвращает file_id.
+    Уже загруженные файлы берутся из реестра медиа без повторной загрузки
+    """
+    file_id = await media_registry.get_file_id(session, photo_path)
+    if file_id:
+        return file_id
     try:
         # Создаем FSInputFile из пути к файлу
         photo = FSInputFile(photo_path)
@@ -72,7 +79,9 @@ async def upload_photo_to_telegram(bot: Bot, photo_path: str) -> str:
             chat_id=ADMIN_IDS[0],
             message_id=result.message_id
         )
-        return result.photo[-1].file_id
+        file_id = result.photo[-1].file_id
+        await media_registry.remember(session, photo_path, file_id)
+        return file_id
     except Exception as e:
         logging.error(f"Ошибка при загрузке фото {photo_path}: {e}")
         raise
@@ -94,12 +103,12 @@ async def create_regular_ad(bot: Bot, session, created_at=None):
         last_shown=None  # Время последнего просмотра изначально 
     )
     session.add(ad)
-    session.flush()
+    await session.flush()
     
     # Загружаем 2-4 фотографии в Telegram
     images = get_random_images(random.randint(2, 4))
     for idx, image_path in enumerate(images):
-        file_id = await upload_photo_to_telegram(bot, image_path)
+        file_id = await upload_photo_to_telegram(bot, session, image_path)
         photo = Photo(
             advertisement_id=ad.id,
             photo_file_id=file_id,
@@ -123,12 +132,12 @@ async def create_promo_ad(bot: Bot, session, created_at=None):
         last_shown=None  # Время последнего просмотра изначально 
     )
     session.add(ad)
-    session.flush()
+    await session.flush()
     
     # Загружаем 3-5 фотографий в Telegram
     images = get_random_images(random.randint(3, 5))
     for idx, image_path in enumerate(images):
-        file_id = await upload_photo_to_telegram(bot, image_path)
+        file_id = await upload_photo_to_telegram(bot, session, image_path)
         photo = Photo(
             advertisement_id=ad.id,
             photo_file_id=file_id,
@@ -141,16 +150,14 @@ async def create_promo_ad(bot: Bot, session, created_at=None):
 async def populate_database():
     """Заполняет базу данных тестовыми данными"""
     # Инициализируем подключение к БД и бота
-    engine = create_engine(DATABASE_URL)
-    Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine)
-    session = Session()
+    await setup_engine(DATABASE_URL)
+    session = get_session()
     bot = Bot(token=BOT_TOKEN)
     
     try:
         # Очищаем существующие данные
-        session.query(Photo).delete()
-        session.query(Advertisement).delete()
+        await session.execute(delete(Photo))
+        await session.execute(delete(Advertisement))
         
         print("Начинаем заполнение базы данных...")
         
@@ -160,25 +167,26 @@ async def populate_database():
             created_at = base_date + timedelta(days=i)
             print(f"Создаю обычное объявление {i+1}/20...")
             await create_regular_ad(bot, session, created_at)
-            session.commit()  # Коммитим после каждого объявления
+            await session.commit()  # Коммитим после каждого объявления
         
         # Создаем рекламные объявления
         for i in range(5):
             print(f"Создаю рекламное объявление {i+1}/5...")
             await create_promo_ad(bot, session)
-            session.commit()  # Коммитим после каждого объявления
+            await session.commit()  # Коммитим после каждого объявления
         
         print("База данных успешно заполнена тестовыми данными!")
         print(f"Создано обычных объявлений: 20")
         print(f"Создано рекламных объявлений: 5")
         
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         print(f"Ошибка при заполнении базы данных: {e}")
         raise
     finally:
-        session.close()
+        await session.close()
         await bot.session.close()
+        await dispose_engine()
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
@@ -1,16 +1,27 @@
 import asyncio
 import logging
+import signal
 from os import getenv
-from typing import List
+from typing import Dict, List
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from dotenv import load_dotenv
-from sqlalchemy.orm import sessionmaker
 
-from bot.database.models import init_db
+from bot.database.session import setup_engine, get_session, dispose_engine
+from bot.utils.view_counter import view_counter
+from bot.utils.analytics import event_log, stats_rollup
+from bot.utils.jobs import job_queue
+from bot.utils.user_activity import user_activity
+from bot.utils.notifications import resume_broadcasts
 from bot.handlers import admin, user
-from bot.config import BOT_TOKEN, ADMIN_IDS, DATABASE_URL
+from bot.utils.webhook import run_webhook
+from bot.utils.fsm_storage import create_fsm_storage
+from bot.utils.catalog import catalog
+from bot.utils.subscriptions import subscription_index
+from bot.utils.promo import promo_scheduler
+from bot.utils.throttling import ThrottlingMiddleware
+from bot.utils.sharding import LEADER_WORKER, UpdateRouter, mp_context, serve_updates, start_workers, stop_workers
+from bot.config import BOT_TOKEN, ADMIN_IDS, DATABASE_URL, RUN_MODE, WORKERS
 
 # Настраиваем логирование в файл
 logging.basicConfig(
@@ -24,36 +35,137 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-# Функция для создания сессии базы данных
-def get_session():
-    engine = init_db(DATABASE_URL)
-    Session = sessionmaker(bind=engine)
-    return Session()
+async def start_services(leader: bool = True):
+    # Создаём движок БД и пул соединений один раз на весь процесс
+    await setup_engine(DATABASE_URL)
+    # Фоновая пакетная запись счётчиков просмотров, журнала событий и пользователей
+    view_counter.start()
+    event_log.start()
+    user_activity.start()
+    # Воркеры фоновых задач (рассылки уведомлений) и свёртка статистики — только
+    # в ведущем процессе: две свёртки одного диапазона событий посчитали бы его дважды
+    if leader:
+        job_queue.start()
+        stats_rollup.start()
+
+
+async def stop_services(bot: Bot, storage, leader: bool = True):
+    await job_queue.stop()
+    await bot.session.close()
+    # Дописываем накопленные просмотры, события и обновления пользователей до закрытия пула
+    await view_counter.stop()
+    await event_log.stop()
+    if leader:
+        await stats_rollup.stop()
+    await user_activity.stop()
+    # Диспетчер закрывает хранилище сам, повторный вызов только дописывает остаток
+    await storage.close()
+    await dispose_engine()
+
+
+def create_dispatcher(storage) -> Dispatcher:
+    dp = Dispatcher(storage=storage)
 
-async def main():
-    # Инициализируем бота и диспетчер
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
-    
     # Регистрируем роутеры
     dp.include_router(admin.router)
     dp.include_router(user.router)
     
+    # Отсекаем флуд до открытия сессии БД
+    dp.update.middleware(ThrottlingMiddleware())
+
     # Middleware для внедрения сессии БД
     @dp.update.middleware()
     async def database_middleware(handler, event, data):
-        session = get_session()
-        data["session"] = session
-        try:
+        async with get_session() as session:
+            data["session"] = session
             return await handler(event, data)
-        finally:
-            session.close()
+
+    return dp
+
+
+async def run_single():
+    await start_services()
+
+    # Инициализируем бота и диспетчер
+    bot = Bot(token=BOT_TOKEN)
+    # Состояния FSM хранятся в БД (или Redis), чтобы переживать перезапуск
+    storage = create_fsm_storage()
+    dp = create_dispatcher(storage)
+    # Продолжаем рассылки, прерванные остановкой бота
+    await resume_broadcasts(bot)
     
     # Запускаем бота
     try:
-        await dp.start_polling(bot)
+        if RUN_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await stop_services(bot, storage)
+
+
+async def worker_main(index: int, updates, generations: Dict):
+    # Кэши каталога, подписок и рекламы сбрасываются во всех воркерах через общие счётчики
+    catalog.generation.attach(generations["catalog"])
+    subscription_index.generation.attach(generations["subscriptions"])
+    promo_scheduler.generation.attach(generations["promos"])
+    leader = index == LEADER_WORKER
+    await start_services(leader)
+
+    bot = Bot(token=BOT_TOKEN)
+    storage = create_fsm_storage()
+    dp = create_dispatcher(storage)
+    # Рассылки выполняет только ведущий воркер, иначе они делили бы outbox
+    if leader:
+        await resume_broadcasts(bot)
+    logger.info(f"Worker {index} started")
+
+    try:
+        await serve_updates(dp, bot, updates)
+    finally:
+        await stop_services(bot, storage, leader)
+        logger.info(f"Worker {index} stopped")
+
+
+def run_worker(index: int, updates, generations: Dict):
+    """Точка входа процесса-воркера"""
+    # Ctrl+C получает вся группа процессов, а останавливает воркеры супервизор
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(worker_main(index, updates, generations))
+
+
+async def run_supervisor():
+    # Схему БД создаёт и мигрирует супервизор, чтобы воркеры не делали это наперегонки
+    await setup_engine(DATABASE_URL)
+    await dispose_engine()
+
+    generations = {
+        "catalog": mp_context.Value("i", 0),
+        "subscriptions": mp_context.Value("i", 0),
+        "promos": mp_context.Value("i", 0),
+    }
+    processes, queues = start_workers(WORKERS, run_worker, generations)
+
+    # Диспетчер супервизора без роутеров: апдейты только раздаются воркерам
+    bot = Bot(token=BOT_TOKEN)
+    dp = Dispatcher()
+    dp.update.outer_middleware(UpdateRouter(queues))
+    try:
+        if RUN_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            # Апдейты раздаются по одному, чтобы очередь воркера получала их в порядке Telegram
+            await dp.start_polling(bot, handle_as_tasks=False)
     finally:
         await bot.session.close()
+        await stop_workers(processes, queues)
+
+
+async def main():
+    if WORKERS > 1:
+        await run_supervisor()
+    else:
+        await run_single()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,130 @@
+"""
+Горячие запросы бота должны идти по индексам, а не полным сканом.
+Запросы выполняются настоящим кодом бота на временной SQLite, их SQL
+перехватывается и прогоняется через EXPLAIN QUERY PLAN.
+"""
+import asyncio
+import os
+from datetime import datetime
+
+os.environ.setdefault("BOT_TOKEN", "1:test")
+os.environ.setdefault("ADMIN_IDS", "1")
+
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker  # noqa: E402
+
+from bot.database.models import Advertisement, Photo, User, init_db  # noqa: E402
+from bot.utils import outbox  # noqa: E402
+from bot.utils.pagination import Cursor, fetch_neighbours  # noqa: E402
+from bot.utils.stats import _TOTALS_QUERY  # noqa: E402
+
+
+def query_plans(tmp_path, scenario):
+    """
+    Выполняет scenario(session) на свежей базе и возвращает планы
+    всех выполненных SELECT/INSERT/UPDATE: [(sql, [строки плана])]
+    """
+    async def run():
+        engine = await init_db(f"sqlite+aiosqlite:///{tmp_path / 'plans.db'}")
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        async with session_factory() as session:
+            session.add(Advertisement(id=1, description="Квартира у метро", price="40.000₽/месяц",
+                                      manager_link="@m", created_at=datetime(2024, 1, 1)))
+            session.add(Photo(advertisement_id=1, photo_file_id="file", position=0))
+            session.add(User(telegram_id=100))
+            await session.commit()
+
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith(("SELECT", "INSERT", "UPDATE")):
+                statements.append((statement, parameters))
+
+        event.listen(engine.sync_engine, "before_cursor_execute", capture)
+        async with session_factory() as session:
+            await scenario(session)
+        event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+        plans = []
+        async with engine.connect() as conn:
+            for statement, parameters in statements:
+                rows = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+                plans.append((statement, [row[-1] for row in rows]))
+        await engine.dispose()
+        return plans
+
+    return asyncio.run(run())
+
+
+def plan_text(plans) -> str:
+    return "\n".join(line for _, lines in plans for line in lines)
+
+
+def assert_uses_index(text: str, index: str):
+    """В плане есть доступ по индексу (обычному или покрывающему)"""
+    assert f"USING INDEX {index}" in text or f"USING COVERING INDEX {index}" in text, text
+
+
+def test_fetch_neighbours_uses_carousel_index(tmp_path):
+    cursor = Cursor(datetime(2024, 6, 1), 10, 1)
+
+    async def scenario(session):
+        await fetch_neighbours(session, cursor, "next", 3)
+        await fetch_neighbours(session, cursor, "prev", 3)
+
+    plans = query_plans(tmp_path, scenario)
+    assert len(plans) == 2
+    for statement, lines in plans:
+        text = "\n".join(lines)
+        assert_uses_index(text, "ix_advertisements_promo_created")
+        assert_uses_index(text, "ix_photos_ad_position")
+
+
+def test_get_with_photos_uses_photo_index(tmp_path):
+    async def scenario(session):
+        assert await Advertisement.get_with_photos(session, 1) is not None
+
+    text = plan_text(query_plans(tmp_path, scenario))
+    assert "USING INTEGER PRIMARY KEY" in text, text
+    assert_uses_index(text, "ix_photos_ad_position")
+
+
+def test_fill_outbox_recipients_use_indexes(tmp_path):
+    async def scenario(session):
+        ad = await session.get(Advertisement, 1)
+        await outbox.fill_outbox(session, ad)
+
+    plans = [
+        (statement, lines) for statement, lines in query_plans(tmp_path, scenario)
+        if "notification_outbox" in statement
+    ]
+    text = plan_text(plans)
+    assert_uses_index(text, "ix_users_notifications_enabled")
+    assert_uses_index(text, "ix_saved_searches_telegram_id")
+
+
+def test_totals_query_uses_ordering_indexes(tmp_path):
+    async def scenario(session):
+        await session.execute(_TOTALS_QUERY)
+
+    text = plan_text(query_plans(tmp_path, scenario))
+    assert_uses_index(text, "ix_advertisements_views_count")
+    assert_uses_index(text, "ix_advertisements_last_shown")
+
+
+def test_claim_batch_uses_outbox_index(tmp_path):
+    async def scenario(session):
+        ad = await session.get(Advertisement, 1)
+        await outbox.fill_outbox(session, ad)
+        await session.commit()
+        assert await outbox.claim_batch(session, 10)
+
+    plans = [
+        (statement, lines) for statement, lines in query_plans(tmp_path, scenario)
+        if statement.lstrip().upper().startswith("SELECT") and "FROM notification_outbox" in statement
+    ]
+    assert len(plans) == 2
+    for statement, lines in plans:
+        text = "\n".join(lines)
+        assert_uses_index(text, "ix_notification_outbox_status_user")
+        assert "SCAN notification_outbox\n" not in text + "\n", text